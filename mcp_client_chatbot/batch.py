@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, TextIO
+from chat_session import ChatSession
+from exceptions import LLMError
+from llm_client import TokenUsage
+
+class BatchRunner:
+    """Runs prompts from a JSONL file as independent conversations over one shared server pool.
+
+    Each input line is {"id": ..., "prompt": "..."} or {"id": ..., "prompts": ["...", ...]}
+    for a multi-turn conversation. One result line per conversation is written to the
+    output JSONL as soon as it finishes.
+    """
+    def __init__(self, chat_session: ChatSession, concurrency: int = 4) -> None:
+        self.chat_session = chat_session
+        self.concurrency = concurrency
+
+    @staticmethod
+    def load_prompts(file_path: str) -> list[dict[str, Any]]:
+        jobs = []
+        with open(file_path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    job = json.loads(line)
+                except json.JSONDecodeError as e:
+                    job = {"error": f"Invalid JSON on line {line_number}: {e}"}
+                if isinstance(job, str):
+                    job = {"prompt": job}
+                elif not isinstance(job, dict):
+                    job = {"error": f"Line {line_number} is not a JSON object or string"}
+                elif "prompts" in job and not (
+                    isinstance(job["prompts"], list) and all(isinstance(p, str) for p in job["prompts"])
+                ):
+                    job = {"id": job.get("id"), "error": f"Line {line_number}: prompts must be a list of strings"}
+                elif "prompts" not in job and "prompt" in job and not isinstance(job["prompt"], str):
+                    job = {"id": job.get("id"), "error": f"Line {line_number}: prompt must be a string"}
+                # 格式错误的行只记录错误结果，不影响其余对话
+                if job.get("id") is None:
+                    job["id"] = line_number
+                jobs.append(job)
+        return jobs
+
+    async def _run_conversation(self, job: dict[str, Any]) -> dict[str, Any]:
+        prompts = job.get("prompts") or ([job["prompt"]] if job.get("prompt") else [])
+        result: dict[str, Any] = {"id": job["id"], "prompts": prompts, "answers": []}
+        if job.get("error") or not prompts:
+            result["error"] = job.get("error") or "No prompt given"
+            return result
+        history = self.chat_session.new_history()
+        usage = TokenUsage()
+        turns = []
+        started = time.monotonic()
+        try:
+            for prompt in prompts:
+                response, report = await self.chat_session.run_turn(history, prompt)
+                usage.add(report.usage)
+                result["answers"].append(response.content)
+                turns.append({
+                    "elapsed_seconds": round(report.elapsed, 3),
+                    "rounds": report.rounds,
+                    "llm_seconds": round(report.llm_seconds, 3),
+                    "tool_seconds": round(report.tool_seconds, 3),
+                    "budget_exhausted": report.budget_exhausted,
+                    "usage": {
+                        "prompt_tokens": report.usage.prompt_tokens,
+                        "completion_tokens": report.usage.completion_tokens,
+                        "total_tokens": report.usage.total_tokens,
+                    },
+                })
+        except LLMError as e:
+            result["error"] = e.message
+        except Exception as e:
+            # 单个对话失败只记录在结果中，不影响其余对话
+            logging.exception(f"Batch conversation {job['id']} failed")
+            result["error"] = f"{type(e).__name__}: {e}"
+        result.update(
+            elapsed_seconds=round(time.monotonic() - started, 3),
+            turns=turns,
+            usage={
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+            },
+        )
+        return result
+
+    async def run(self, input_path: str, output_path: str) -> dict[str, Any]:
+        """Start the servers once, run every conversation and write the results."""
+        jobs = self.load_prompts(input_path)
+        # 并发对话的文本增量会相互穿插，批处理固定使用非流式请求
+        self.chat_session.stream = False
+        semaphore = asyncio.Semaphore(self.concurrency)
+        summary = {"conversations": len(jobs), "failed": 0, "total_tokens": 0}
+        started = time.monotonic()
+
+        async def run_one(job: dict[str, Any], output: TextIO) -> None:
+            async with semaphore:
+                result = await self._run_conversation(job)
+            if "error" in result:
+                summary["failed"] += 1
+            summary["total_tokens"] += result.get("usage", {}).get("total_tokens", 0)
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+            logging.info(
+                f"Conversation {job['id']} finished in {result.get('elapsed_seconds', 0)}s"
+                + (f" with error: {result['error']}" if "error" in result else "")
+            )
+
+        try:
+            await self.chat_session.initialize_servers()
+            with open(output_path, "w", encoding="utf-8") as output:
+                await asyncio.gather(*(run_one(job, output) for job in jobs))
+        finally:
+            await self.chat_session.cleanup_servers()
+        summary["elapsed_seconds"] = round(time.monotonic() - started, 3)
+        logging.info(
+            f"Batch finished: {summary['conversations']} conversations, {summary['failed']} failed, "
+            f"{summary['total_tokens']} tokens in {summary['elapsed_seconds']}s."
+        )
+        return summary
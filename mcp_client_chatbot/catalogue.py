@@ -0,0 +1,119 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+from typing import Any
+from tool import Tool
+
+# 与脚本同目录、决定服务器依赖版本的文件
+_LOCK_FILES = ("uv.lock", "pyproject.toml", "requirements.txt", "package.json", "package-lock.json")
+
+def source_fingerprint(args: list[str]) -> str | None:
+    """Hash the source files and lockfiles of a server found through the paths in its args.
+
+    Returns None when no argument points at a local file or directory (e.g. npx packages).
+    """
+    paths: set[str] = set()
+    for arg in args:
+        if not isinstance(arg, str):
+            continue
+        if os.path.isfile(arg):
+            directory = os.path.dirname(os.path.abspath(arg))
+            paths.add(os.path.abspath(arg))
+        elif os.path.isdir(arg):
+            directory = os.path.abspath(arg)
+        else:
+            continue
+        # 脚本所在目录的其他模块（如 rg_search.py）也会影响工具列表
+        paths.update(glob.glob(os.path.join(directory, "*.py")))
+        paths.update(
+            os.path.join(directory, name) for name in _LOCK_FILES
+            if os.path.isfile(os.path.join(directory, name))
+        )
+    if not paths:
+        return None
+    digest = hashlib.sha256()
+    for path in sorted(paths):
+        digest.update(os.path.basename(path).encode("utf-8"))
+        try:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            continue
+    return digest.hexdigest()[:16]
+
+
+class ToolCatalogue:
+    """Persists each server's tool list for warm starts and lazy servers.
+
+    Entries are keyed by the server's command, args and a fingerprint of its
+    source and lockfiles, so editing or upgrading a server invalidates its entry.
+    """
+    def __init__(self, file_path: str) -> None:
+        self.file_path = file_path
+        self._entries: dict[str, Any] = self._load()
+        self._fingerprints: dict[str, str | None] = {}
+
+    def _load(self) -> dict[str, Any]:
+        """Load the catalogue file, ignoring a missing or corrupt file."""
+        try:
+            with open(self.file_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable tool catalogue {self.file_path}: {e}")
+            return {}
+
+    def _save(self) -> None:
+        """Write the catalogue atomically."""
+        directory = os.path.dirname(self.file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.file_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.file_path)
+
+    def _config_key(self, config: dict[str, Any]) -> dict[str, Any]:
+        """The parts of a server config that determine its tool list."""
+        if config.get("url"):
+            return {"url": config["url"]}
+        args = config.get("args", [])
+        # 每次运行只计算一次指纹
+        cache_key = json.dumps(args)
+        if cache_key not in self._fingerprints:
+            self._fingerprints[cache_key] = source_fingerprint(args)
+        return {
+            "command": config.get("command"),
+            "args": args,
+            "fingerprint": self._fingerprints[cache_key],
+        }
+
+    def get(self, server_name: str, config: dict[str, Any]) -> list[Tool] | None:
+        """Return the cached tools for a server, or None if missing or outdated."""
+        entry = self._entries.get(server_name)
+        if not entry or entry.get("config") != self._config_key(config):
+            return None
+        return [
+            Tool(tool["name"], tool.get("description"), tool.get("inputSchema", {}))
+            for tool in entry.get("tools", [])
+        ]
+
+    def update(self, server_name: str, config: dict[str, Any], tools: list[Tool]) -> None:
+        """Record the tools a server currently exposes."""
+        entry = {
+            "config": self._config_key(config),
+            "tools": [
+                {"name": tool.name, "description": tool.description, "inputSchema": tool.input_schema}
+                for tool in tools
+            ],
+        }
+        if self._entries.get(server_name) == entry:
+            return
+        self._entries[server_name] = entry
+        try:
+            self._save()
+        except OSError as e:
+            logging.warning(f"Failed to write tool catalogue {self.file_path}: {e}")
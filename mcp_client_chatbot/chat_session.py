@@ -1,18 +1,219 @@
 import asyncio
 import json
 import logging
+import sys
+import time
 from typing import Any
-from llm_client import LLMClient
+from exceptions import LLMError
+from history import ConversationHistory, TokenCounter
+from llm_client import LLMClient, TokenUsage
+from result_store import ResultStore
 from server import Server
+from server_pool import ServerPool, current_conversation
+from supervisor import ServerSupervisor
+from tool import Tool
+from tool_selector import ToolSelector
+from tracing import Span, tracer
+
+SYSTEM_MESSAGE = "你是一名智能助手,请根据用户的问题选择合适的工具。若不需要使用工具，请直接回复"
+
+class TurnReport:
+    """Per-turn statistics: rounds, time split between LLM and tools, and token usage."""
+    def __init__(self) -> None:
+        self.rounds = 0
+        self.llm_seconds = 0.0
+        self.tool_seconds = 0.0
+        self.started_at = time.monotonic()
+        self.usage = TokenUsage()
+        self.budget_exhausted: str | None = None
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def summary(self) -> str:
+        text = (
+            f"rounds={self.rounds} elapsed={self.elapsed:.2f}s "
+            f"llm={self.llm_seconds:.2f}s tools={self.tool_seconds:.2f}s "
+            f"tokens={self.usage.total_tokens} "
+            f"(prompt={self.usage.prompt_tokens}, completion={self.usage.completion_tokens})"
+        )
+        if self.budget_exhausted:
+            text += f" budget_exhausted={self.budget_exhausted}"
+        return text
 
 class ChatSession:
     """Orchestrates the interaction between user, LLM, and tools."""
-    def __init__(self, servers: list[Server], llm_client: LLMClient) -> None:
+    def __init__(
+        self,
+        servers: list[Server | ServerPool],
+        llm_client: LLMClient,
+        startup_timeout: float = 30.0,
+        stream: bool = False,
+        history_token_budget: int = 32000,
+        result_store: ResultStore | None = None,
+        max_rounds: int = 10,
+        turn_timeout: float = 300.0,
+        max_turn_tokens: int = 200000,
+        tool_top_k: int = 12,
+        pinned_tools: list[str] | None = None,
+        tool_description_max_chars: int = 1500,
+        health_check_interval: float = 30.0,
+        ping_timeout: float = 10.0,
+        warm_start: bool = True,
+    ) -> None:
         self.servers = servers
         self.llm_client = llm_client
+        self.startup_timeout = startup_timeout
+        # 热启动：交互模式下有缓存工具目录的服务器在后台连接，无需等待即可进入对话
+        self.warm_start = warm_start
+        # 定期 ping 已连接的服务器，崩溃或无响应时自动重启
+        self.supervisor = ServerSupervisor(servers, health_check_interval, ping_timeout)
+        # 流式模式：文本增量实时输出，工具调用参数接收完整后立即开始执行
+        self.stream = stream
+        self.history_token_budget = history_token_budget
+        # 每个用户回合的预算：LLM 轮数、墙钟时间、累计 token
+        self.max_rounds = max_rounds
+        self.turn_timeout = turn_timeout
+        self.max_turn_tokens = max_turn_tokens
+        # 按相关性为每个回合挑选工具，缩小请求中的 tools 负载；0 表示始终发送全部工具
+        self.tool_top_k = tool_top_k
+        self.pinned_tools = list(pinned_tools or [])
+        self._tool_selector: ToolSelector | None = None
+        self.tool_description_max_chars = tool_description_max_chars
+        # 超过阈值的工具结果写入本地存储，LLM 只看到预览和句柄
+        self.result_store = result_store
+        # 客户端内置工具：工具名 -> (Tool, 处理函数)
+        self.local_tools: dict[str, tuple[Tool, Any]] = {}
+        if result_store:
+            tool = result_store.as_tool()
+            self.local_tools[tool.name] = (tool, result_store.call_tool)
+            self.pinned_tools.append(tool.name)
+        # 工具名 -> Server 的路由表，避免每次工具调用都向所有服务器 list_tools
+        self.tool_routes: dict[str, Server | ServerPool] = {}
+        self._server_tools: dict[str, list[Tool]] = {}
+        self._indexed_versions: dict[str, int] = {}
+        self._routes_lock: asyncio.Lock = asyncio.Lock()
+
+    async def refresh_tool_routes(self) -> None:
+        """Rebuild the tool routing index for servers whose tool list changed."""
+        async with self._routes_lock:
+            changed = False
+            for server in self.servers:
+                if not server.has_tools:
+                    # 启动失败或已断开的服务器从路由表中移除
+                    if self._server_tools.pop(server.name, None) is not None:
+                        self._indexed_versions.pop(server.name, None)
+                        changed = True
+                    continue
+                version = server.tools_version
+                if self._indexed_versions.get(server.name) == version:
+                    continue
+                self._server_tools[server.name] = await server.list_tools()
+                self._indexed_versions[server.name] = version
+                self._report_schema_sizes(server.name, self._server_tools[server.name])
+                changed = True
+            if changed:
+                self._rebuild_routes()
+
+    def _rebuild_routes(self) -> None:
+        """Rebuild the tool name -> server map from the indexed tool lists."""
+        routes: dict[str, Server | ServerPool] = {}
+        for server in self.servers:
+            for tool in self._server_tools.get(server.name, []):
+                if tool.name in routes:
+                    logging.warning(
+                        f"Tool {tool.name} is provided by both {routes[tool.name].name} "
+                        f"and {server.name}; using {routes[tool.name].name}."
+                    )
+                    continue
+                routes[tool.name] = server
+        self.tool_routes = routes
+        self._tool_selector = None
+
+    def _report_schema_sizes(self, server_name: str, tools: list[Tool]) -> None:
+        """Log the token size of each tool schema before and after compaction."""
+        counter = TokenCounter()
+        raw_total = compact_total = 0
+        for tool in tools:
+            raw = counter.count_tools([tool.format_raw()])
+            compact = counter.count_tools([self.format_tool(tool)])
+            raw_total += raw
+            compact_total += compact
+            logging.info(f"Tool {tool.name} schema: {raw} -> {compact} tokens")
+        logging.info(f"Server {server_name} tool schemas: {raw_total} -> {compact_total} tokens")
+
+    def format_tool(self, tool: Tool) -> dict[str, Any]:
+        return tool.format_for_llm(self.tool_description_max_chars)
+
+    def get_all_tools(self) -> list[Tool]:
+        """Return all indexed and built-in tools sorted by name.
+
+        A stable order keeps the serialized request prefix byte-identical
+        across turns so provider-side prompt caching can hit.
+        """
+        all_tools = []
+        for server in self.servers:
+            all_tools.extend(self._server_tools.get(server.name, []))
+        all_tools.extend(tool for tool, _ in self.local_tools.values())
+        return sorted(all_tools, key=lambda tool: tool.name)
+
+    def select_tools(self, query: str) -> list[Tool]:
+        """Pick the tools relevant to a user query (pinned tools are always included)."""
+        if self.tool_top_k <= 0:
+            return self.get_all_tools()
+        if self._tool_selector is None:
+            self._tool_selector = ToolSelector(
+                self.get_all_tools(), top_k=self.tool_top_k, pinned=self.pinned_tools
+            )
+        return self._tool_selector.select(query)
+
+    async def find_server(self, tool_name: str) -> Server | ServerPool | None:
+        """Look up the server providing a tool via the routing index."""
+        await self.refresh_tool_routes()
+        return self.tool_routes.get(tool_name)
+
+    async def _initialize_server(self, server: Server | ServerPool) -> None:
+        logging.info(f"Initializing MCP server: {server.name}...")
+        await server.initialize()
+        logging.info(f"MCP server {server.name} initialized successfully.")
+
+    async def initialize_servers(self, warm_start: bool = False) -> None:
+        """Start all non-lazy servers concurrently within the startup deadline.
+
+        With warm_start, servers with a cached catalogue connect in the background
+        instead and their cached tools are offered in the meantime.
+        """
+        tasks = {}
+        for server in self.servers:
+            if server.can_start_lazily:
+                logging.info(f"MCP server {server.name} will be started on first use.")
+            elif warm_start and server.cached_tools is not None:
+                logging.info(f"MCP server {server.name} is starting in the background, using its cached tools.")
+                server.start_in_background(self.startup_timeout)
+            else:
+                tasks[asyncio.create_task(self._initialize_server(server))] = server
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=self.startup_timeout)
+            for task in pending:
+                logging.error(
+                    f"MCP server {tasks[task].name} did not start within "
+                    f"{self.startup_timeout} seconds, skipping it."
+                )
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            # 启动失败的服务器只记录日志，不影响其他服务器和会话
+            for task in done:
+                if task.exception():
+                    logging.error(
+                        f"Failed to initialize MCP server {tasks[task].name}: {task.exception()}"
+                    )
+        await self.refresh_tool_routes()
+        self.supervisor.start()
 
     async def cleanup_servers(self) -> None:
         """Clean up all servers properly."""
+        await self.supervisor.stop()
         cleanup_tasks = []
         for server in self.servers:
             cleanup_tasks.append(asyncio.create_task(server.cleanup()))
@@ -22,109 +223,271 @@ class ChatSession:
             except Exception as e:
                 logging.warning(f"Warning during final cleanup: {e}")
 
-    async def process_llm_response(self, llm_response: str) -> str:    
+    @staticmethod
+    def _format_tool_result(result: Any) -> str:
+        """Flatten a CallToolResult into plain text for the LLM."""
+        if isinstance(result.content, list):
+            return "\n".join(
+                item.get("text") if isinstance(item, dict) and "text" in item
+                else getattr(item, "text", None) or str(item)
+                for item in result.content
+            )
+        return str(result.content)
+
+    async def _invoke_tool(self, tool_name: str, tool_args: dict[str, Any], span: Span) -> str:
+        """Run a local or server tool and return its result text (errors included)."""
+        if tool_name in self.local_tools:
+            span.set(server="local")
+            _, handler = self.local_tools[tool_name]
+            try:
+                return await handler(tool_args)
+            except Exception as e:
+                span.set(error=type(e).__name__)
+                content_str = f"Error executing tool: {str(e)}"
+                logging.error(content_str)
+                return content_str
+        server = await self.find_server(tool_name)
+        if server is None:
+            span.set(error="ToolNotFound")
+            content_str = f"No server found with tool: {tool_name}"
+            logging.error(content_str)
+            return content_str
+        span.set(server=server.name)
+        try:
+            result = await server.execute_tool(tool_name, tool_args)
+            content_str = self._format_tool_result(result)
+            span.set(result_bytes=len(content_str.encode("utf-8")), is_error=bool(result.isError))
+            #debug for print
+            logging.info(f"Tool {tool_name} executed successfully ({len(content_str)} chars).")
+            if self.result_store:
+                content_str = self.result_store.spill(content_str)
+        except Exception as e:
+            # 单个工具失败只作为该调用的结果返回，不影响同一轮的其他调用
+            span.set(error=type(e).__name__)
+            content_str = f"Error executing tool: {str(e)}"
+            logging.error(content_str)
+        return content_str
+
+    async def _execute_tool_call(self, tool_call: Any) -> dict[str, Any]:
+        """Execute a single tool call and wrap the outcome as a tool message."""
+        tool_name = tool_call.function.name
+        #debug for print
+        logging.info(f"start calling tools: {tool_name}...")
+        try:
+            tool_args = json.loads(tool_call.function.arguments)
+        except json.JSONDecodeError:
+            tool_args = {}
+        arg_bytes = len((tool_call.function.arguments or "").encode("utf-8"))
+        with tracer.span("tool.call", tool=tool_name, arg_bytes=arg_bytes) as span:
+            content_str = await self._invoke_tool(tool_name, tool_args, span)
+        return {
+            "role": "tool",
+            "tool_call_id": tool_call.id,
+            "content": content_str,
+        }
+
+    async def process_llm_response(
+        self,
+        llm_response: Any,
+        started_calls: dict[str, asyncio.Task] | None = None,
+    ) -> list[dict[str, Any]] | str:
         if hasattr(llm_response, "tool_calls") and llm_response.tool_calls:
-            tool_messages = []
-            for tool_call in llm_response.tool_calls:
-                tool_name = tool_call.function.name
-                #debug for print
-                logging.info(f"start calling tools: {tool_name}...")
-                try:
-                    tool_args = json.loads(tool_call.function.arguments)
-                except json.JSONDecodeError:
-                    tool_args = {}
-                found = False
-                for server in self.servers:
-                    tools = await server.list_tools()
-                    if any(tool.name == tool_name for tool in tools):
-                        found = True
-                        try:
-                            result = await server.execute_tool(tool_name, tool_args)
-                            #debug for print
-                            logging.info(f"Tool {tool_name} executed successfully: {result}")
-                            if isinstance(result.content, list):
-                                content_str = "\n".join(
-                                    item.get("text") if isinstance(item, dict) and "text" in item else str(item)
-                                    for item in result.content
-                                )
-                            else:
-                                content_str = str(result.content)
-                            #logging.info(f"Tool {content_str}")
-                            tool_message = {
-                                "role": "tool",
-                                "tool_call_id": tool_call.id,
-                                "content": content_str,      
-                            }
-                            tool_messages.append(tool_message)
-                        except Exception as e:
-                                error_msg = f"Error executing tool: {str(e)}"
-                                logging.error(error_msg)
-                                return error_msg
-                        break
-                if not found:
-                    error_message = f"No server found with tool: {tool_name}"
-                    logging.error(error_message)
-                    tool_messages.append({
-                        "role": "error",
-                        "tool_call_id": tool_call.id,
-                        "content": error_message
-                    })
-            return tool_messages
+            # 同一轮内的多个工具调用并发执行，每个服务器的并发度由 Server 自身限制；
+            # 流式模式下已提前启动的调用直接复用其任务。gather 按 tool_calls 的顺序返回结果
+            started_calls = started_calls or {}
+            tool_messages = await asyncio.gather(
+                *(
+                    started_calls.get(tool_call.id) or self._execute_tool_call(tool_call)
+                    for tool_call in llm_response.tool_calls
+                )
+            )
+            return list(tool_messages)
         #debug for print
         #logging.info(f"no need calling tools...")
-        return llm_response.content                
+        return llm_response.content
+
+    @staticmethod
+    def _print_delta(text: str) -> None:
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    async def _stream_llm_response(
+        self, messages, available_tools, usage: TokenUsage | None = None, dispatch_tools: bool = True
+    ) -> tuple[Any, dict[str, asyncio.Task]]:
+        """Stream one completion, dispatching each tool call as soon as it is complete (unless dispatch_tools is False)."""
+        started_calls: dict[str, asyncio.Task] = {}
+
+        def dispatch(tool_call: Any) -> None:
+            started_calls[tool_call.id] = asyncio.create_task(self._execute_tool_call(tool_call))
+
+        try:
+            llm_response = await self.llm_client.stream_response(
+                messages,
+                available_tools,
+                on_text=self._print_delta,
+                on_tool_call=dispatch if dispatch_tools else None,
+                usage=usage,
+            )
+        except BaseException:
+            for task in started_calls.values():
+                task.cancel()
+            await asyncio.gather(*started_calls.values(), return_exceptions=True)
+            raise
+        if llm_response.content:
+            sys.stdout.write("\n")
+        return llm_response, started_calls
 
-    async def get_final_response(self, messages, available_tools):
-        llm_response = self.llm_client.get_response(messages, available_tools)
-        messages.append(llm_response)
-        logging.info("API Direct Response: %s", llm_response)
+    def _exhausted_budget(self, report: TurnReport) -> str | None:
+        """Name the per-turn budget that has run out, if any."""
+        if report.rounds >= self.max_rounds:
+            return f"max_rounds ({self.max_rounds})"
+        if report.elapsed >= self.turn_timeout:
+            return f"turn_timeout ({self.turn_timeout}s)"
+        if report.usage.total_tokens >= self.max_turn_tokens:
+            return f"max_turn_tokens ({self.max_turn_tokens})"
+        return None
 
-        tool_message = await self.process_llm_response(llm_response)
-        if tool_message != llm_response.content and isinstance(tool_message, list) and tool_message:
-            messages.extend(tool_message)
-            return await self.get_final_response(messages, available_tools)
-        else:
-            return llm_response
+    async def _run_tool_calls(
+        self, llm_response: Any, started_calls: dict[str, asyncio.Task] | None, report: TurnReport
+    ) -> list[dict[str, Any]]:
+        """Run the tool calls of one round within the remaining turn time."""
+        remaining = max(self.turn_timeout - report.elapsed, 0)
+        try:
+            return await asyncio.wait_for(
+                self.process_llm_response(llm_response, started_calls), timeout=remaining
+            )
+        except asyncio.TimeoutError:
+            # 超时的调用也要有对应的 tool 消息，保证 tool_calls 与结果成对
+            logging.warning("Turn time budget ran out while tools were running.")
+            for task in (started_calls or {}).values():
+                task.cancel()
+            return [
+                {
+                    "role": "tool",
+                    "tool_call_id": tool_call.id,
+                    "content": "Error executing tool: cancelled because the turn time budget ran out",
+                }
+                for tool_call in llm_response.tool_calls
+            ]
+
+    async def get_final_response(
+        self,
+        history: ConversationHistory,
+        available_tools,
+        report: TurnReport | None = None,
+    ):
+        """Run LLM/tool rounds until the model answers or a turn budget runs out."""
+        report = report or TurnReport()
+        with tracer.span("turn") as span:
+            try:
+                return await self._run_rounds(history, available_tools, report)
+            finally:
+                span.set(
+                    rounds=report.rounds,
+                    llm_seconds=round(report.llm_seconds, 3),
+                    tool_seconds=round(report.tool_seconds, 3),
+                    prompt_tokens=report.usage.prompt_tokens,
+                    completion_tokens=report.usage.completion_tokens,
+                    budget_exhausted=report.budget_exhausted,
+                )
+
+    async def _run_rounds(
+        self, history: ConversationHistory, available_tools, report: TurnReport
+    ):
+        while True:
+            exhausted = self._exhausted_budget(report)
+            if exhausted:
+                # 预算耗尽：不再提供工具，要求模型基于已有信息直接作答
+                report.budget_exhausted = exhausted
+                logging.warning(f"Turn budget {exhausted} exhausted, asking for a final answer.")
+                history.compact()
+                messages = history.messages + [{
+                    "role": "system",
+                    "content": "工具调用预算已用尽，请不要再调用工具，直接根据已有信息给出最终回答。",
+                }]
+                available_tools = None
+            else:
+                # 每次请求前按 token 预算压缩历史
+                history.compact()
+                messages = history.messages
+            report.rounds += 1
+            llm_started = time.monotonic()
+            started_calls = None
+            if self.stream:
+                # 预算耗尽后模型仍可能返回工具调用，此时不得提前执行
+                llm_response, started_calls = await self._stream_llm_response(
+                    messages, available_tools, report.usage, dispatch_tools=not exhausted
+                )
+            else:
+                llm_response = await self.llm_client.get_response(
+                    messages, available_tools, report.usage
+                )
+            report.llm_seconds += time.monotonic() - llm_started
+            history.append(llm_response)
+            logging.debug("API Direct Response: %s", llm_response)
+
+            if exhausted and llm_response.tool_calls:
+                # 模型仍返回了工具调用：补上未执行的结果，保持历史对 API 有效
+                history.extend(
+                    {
+                        "role": "tool",
+                        "tool_call_id": tool_call.id,
+                        "content": "Not executed: the turn budget is exhausted",
+                    }
+                    for tool_call in llm_response.tool_calls
+                )
+            if exhausted or not llm_response.tool_calls:
+                return llm_response
+            tools_started = time.monotonic()
+            tool_messages = await self._run_tool_calls(llm_response, started_calls, report)
+            report.tool_seconds += time.monotonic() - tools_started
+            history.extend(tool_messages)
+            offered = {tool["function"]["name"] for tool in available_tools or []}
+            if any(tool_call.function.name not in offered for tool_call in llm_response.tool_calls):
+                # 模型请求了未提供的工具：本回合剩余轮次改为发送全部工具
+                logging.info("Model asked for a tool outside the selected set, sending all tools.")
+                available_tools = [self.format_tool(tool) for tool in self.get_all_tools()]
+
+    def new_history(self) -> ConversationHistory:
+        """Start an empty conversation; one session can run many conversations concurrently."""
+        return ConversationHistory(SYSTEM_MESSAGE, token_budget=self.history_token_budget)
+
+    async def run_turn(self, history: ConversationHistory, user_input: str) -> tuple[Any, TurnReport]:
+        """Run one user turn to its final answer and return it with the turn's statistics."""
+        history.add_user_message(user_input)
+        current_conversation.set(history.conversation_id)
+        # 工具列表变化（tools/list_changed 或重连）后同步给 LLM
+        await self.refresh_tool_routes()
+        available_tools = [self.format_tool(tool) for tool in self.select_tools(user_input)]
+        report = TurnReport()
+        final_response = await self.get_final_response(history, available_tools, report)
+        return final_response, report
 
     async def start(self) -> None:
         """Main chat session handler."""
         try:
-            for server in self.servers:
-                try:
-                    logging.info(f"Initializing MCP server: {server.name}...")
-                    await server.initialize()
-                    logging.info(f"MCP server {server.name} initialized successfully.")
-                except Exception as e:
-                    logging.error(f"Failed to initialize MCP server {server.name}: {e}")
-                    await self.cleanup_servers()
-                    return
-
-            all_tools = []
-            for server in self.servers:
-                tools = await server.list_tools()
-                # debug for print
-                # print(f"Server: {server.name}")
-                # for tool in tools:
-                #     print(f" * Tool: {tool.name} - {tool.description}")              
-                all_tools.extend(tools)
-
-            available_tools = [tool.format_for_llm() for tool in all_tools]
-            system_message = (
-                "你是一名智能助手,请根据用户的问题选择合适的工具。若不需要使用工具，请直接回复"
-            )
-            messages = [{"role": "system", "content": system_message}]
+            started = time.monotonic()
+            await self.initialize_servers(warm_start=self.warm_start)
+            logging.info(f"Ready for input after {(time.monotonic() - started) * 1000:.0f} ms.")
+            # debug for print
+            # for tool_name, server in self.tool_routes.items():
+            #     print(f" * Tool: {tool_name} -> {server.name}")
+            history = self.new_history()
 
             while True:
                 try:
-                    user_input = input("You: ").strip().lower()
+                    # 在线程中读取输入，避免阻塞事件循环（MCP 通知、后台任务等）
+                    user_input = (await asyncio.to_thread(input, "You: ")).strip().lower()
                     if user_input in ["quit", "exit"]:
                         logging.info("\nExiting...")
                         break
-                    messages.append({"role": "user", "content": user_input})
-                    
-                    final_response = await self.get_final_response(messages, available_tools)
-                    logging.info("Answer: %s", final_response.content)
-                except KeyboardInterrupt:
+                    final_response, report = await self.run_turn(history, user_input)
+                    if not self.stream:
+                        logging.info("Answer: %s", final_response.content)
+                    logging.info(f"Turn stats: {report.summary()}")
+                except LLMError as e:
+                    logging.error(f"Failed to get an answer: {e.message}")
+                except (KeyboardInterrupt, EOFError):
                     logging.info("\nExiting...")
                     break
         finally:
@@ -9,6 +9,33 @@ class Configuration:
         self.load_env()
         self.api_key = os.getenv("API_KEY")
         self.base_url = os.getenv("BASE_URL")
+        self.llm_model = os.getenv("LLM_MODEL", "deepseek-chat")
+        self.llm_temperature = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+        self.llm_max_tokens = int(os.getenv("LLM_MAX_TOKENS", "4096"))
+        self.llm_max_connections = int(os.getenv("LLM_MAX_CONNECTIONS", "10"))
+        self.llm_max_keepalive_connections = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "5"))
+        self.llm_connect_timeout = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+        self.llm_read_timeout = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+        self.llm_stream = os.getenv("LLM_STREAM", "false").lower() in ("1", "true", "yes")
+        self.history_token_budget = int(os.getenv("HISTORY_TOKEN_BUDGET", "32000"))
+        self.result_spill_threshold = int(os.getenv("RESULT_SPILL_THRESHOLD", "16384"))
+        self.tool_cache_max_bytes = int(os.getenv("TOOL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+        self.max_rounds = int(os.getenv("TURN_MAX_ROUNDS", "10"))
+        self.turn_timeout = float(os.getenv("TURN_TIMEOUT", "300"))
+        self.max_turn_tokens = int(os.getenv("TURN_MAX_TOKENS", "200000"))
+        self.tool_top_k = int(os.getenv("TOOL_SELECTION_TOP_K", "12"))
+        self.pinned_tools = [
+            name.strip() for name in os.getenv("TOOL_SELECTION_PINNED", "").split(",") if name.strip()
+        ]
+        self.tool_description_max_chars = int(os.getenv("TOOL_DESCRIPTION_MAX_CHARS", "1500"))
+        self.server_startup_timeout = float(os.getenv("SERVER_STARTUP_TIMEOUT", "30"))
+        self.health_check_interval = float(os.getenv("SERVER_HEALTH_CHECK_INTERVAL", "30"))
+        self.ping_timeout = float(os.getenv("SERVER_PING_TIMEOUT", "10"))
+        self.warm_start = os.getenv("WARM_START", "true").lower() in ("1", "true", "yes")
+        self.batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "4"))
+        if self.batch_concurrency < 1:
+            raise ValueError("BATCH_CONCURRENCY must be at least 1")
+        self.cache_dir = os.getenv("MCP_CACHE_DIR", ".mcp_cache")
 
     @staticmethod
     def load_env() -> None:
@@ -0,0 +1,23 @@
+class LLMError(Exception):
+    """Raised when a request to the LLM provider fails."""
+    def __init__(self, message: str, cause: Exception | None = None):
+        super().__init__(message)
+        self.message = message
+        self.cause = cause
+
+class ServerUnavailableError(Exception):
+    """Raised when a server's circuit breaker is open and calls fail fast."""
+    def __init__(self, server_name: str, retry_after: float):
+        super().__init__(
+            f"Server {server_name} is unavailable after repeated failures, "
+            f"retry in {max(retry_after, 0):.0f} seconds"
+        )
+        self.server_name = server_name
+        self.retry_after = retry_after
+
+class ToolTimeoutError(Exception):
+    """Raised when a tool call exceeds its configured timeout."""
+    def __init__(self, tool_name: str, timeout: float):
+        super().__init__(f"Tool {tool_name} timed out after {timeout} seconds")
+        self.tool_name = tool_name
+        self.timeout = timeout
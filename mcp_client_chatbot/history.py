@@ -0,0 +1,162 @@
+import json
+import logging
+import re
+import uuid
+from typing import Any
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken 为可选依赖，缺失时使用字符估算
+    tiktoken = None
+
+_STUB_PREFIX = "[Earlier tool result omitted to save context:"
+_CJK_PATTERN = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+class TokenCounter:
+    """Counts tokens locally, using tiktoken when available and a character estimate otherwise."""
+    def __init__(self, encoding_name: str = "cl100k_base") -> None:
+        self._encoding = None
+        if tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logging.warning(f"Falling back to estimated token counts: {e}")
+
+    def count_text(self, text: str | None) -> int:
+        """Count the tokens of a piece of text."""
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        # 估算：中日韩字符约 1 token/字，其余约 4 字符/token
+        cjk = len(_CJK_PATTERN.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def count_message(self, message: dict[str, Any]) -> int:
+        """Count the tokens of a chat message, including tool calls."""
+        tokens = 4 + self.count_text(message.get("content"))
+        for tool_call in message.get("tool_calls") or []:
+            function = tool_call.get("function", {})
+            tokens += 4 + self.count_text(function.get("name")) + self.count_text(function.get("arguments"))
+        return tokens
+
+    def count_tools(self, tools: list[dict[str, Any]]) -> int:
+        """Count the tokens of a tools payload."""
+        return sum(self.count_text(json.dumps(tool, ensure_ascii=False)) for tool in tools)
+
+
+def message_to_dict(message: Any) -> dict[str, Any]:
+    """Convert an SDK message object into a plain chat message dict."""
+    if isinstance(message, dict):
+        return message
+    return message.model_dump(exclude_none=True)
+
+
+class ConversationHistory:
+    """Keeps chat messages within a token budget by stubbing and dropping old turns."""
+    def __init__(
+        self,
+        system_message: str,
+        token_budget: int = 32000,
+        stub_threshold: int = 500,
+        keep_recent_turns: int = 2,
+        counter: TokenCounter | None = None,
+    ) -> None:
+        self.system_message = {"role": "system", "content": system_message}
+        # 对话标识，副本池按它做粘性路由
+        self.conversation_id = uuid.uuid4().hex
+        self.token_budget = token_budget
+        self.stub_threshold = stub_threshold
+        self.keep_recent_turns = keep_recent_turns
+        self.counter = counter or TokenCounter()
+        self._turns: list[list[dict[str, Any]]] = []
+        self._dropped_questions: list[str] = []
+
+    @property
+    def messages(self) -> list[dict[str, Any]]:
+        """The messages to send to the LLM."""
+        messages = [self.system_message]
+        summary = self._summary_message()
+        if summary:
+            messages.append(summary)
+        for turn in self._turns:
+            messages.extend(turn)
+        return messages
+
+    def add_user_message(self, content: str) -> None:
+        """Start a new turn with a user message."""
+        self._turns.append([{"role": "user", "content": content}])
+
+    def append(self, message: Any) -> None:
+        """Append an assistant or tool message to the current turn."""
+        if not self._turns:
+            self._turns.append([])
+        self._turns[-1].append(message_to_dict(message))
+
+    def extend(self, messages: list[Any]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def token_count(self) -> int:
+        return sum(self.counter.count_message(message) for message in self.messages)
+
+    def _summary_message(self) -> dict[str, Any] | None:
+        if not self._dropped_questions:
+            return None
+        # 只保留最近若干个被丢弃的问题，避免摘要本身无限增长
+        questions = "; ".join(q[:200] for q in self._dropped_questions[-10:])
+        return {
+            "role": "system",
+            "content": (
+                f"{len(self._dropped_questions)} earlier turns were removed to save context. "
+                f"Recent earlier user questions: {questions}"
+            ),
+        }
+
+    def _stub_tool_message(self, message: dict[str, Any]) -> int:
+        """Replace a large tool result with a short stub; return the tokens saved."""
+        content = message.get("content") or ""
+        if message.get("role") != "tool" or content.startswith(_STUB_PREFIX):
+            return 0
+        tokens = self.counter.count_text(content)
+        if tokens <= self.stub_threshold:
+            return 0
+        first_line = content.strip().splitlines()[0][:200] if content.strip() else ""
+        message["content"] = f"{_STUB_PREFIX} {len(content)} characters. First line: {first_line}]"
+        return tokens - self.counter.count_text(message["content"])
+
+    def _stub_messages(self, messages: list[dict[str, Any]], total: int) -> int:
+        """Stub tool results in order until the budget is met; return the new total."""
+        for message in messages:
+            if total <= self.token_budget:
+                break
+            total -= self._stub_tool_message(message)
+        return total
+
+    def compact(self) -> None:
+        """Shrink the history until it fits the token budget.
+
+        Old tool results are stubbed first, then whole turns are dropped from the
+        oldest, so tool_calls and their tool results always stay together. The
+        current turn is never dropped.
+        """
+        total = self.token_count()
+        if total <= self.token_budget:
+            return
+        before = total
+        old_turns = self._turns[:-self.keep_recent_turns] if self.keep_recent_turns else self._turns
+        total = self._stub_messages([m for turn in old_turns for m in turn], total)
+        while total > self.token_budget and len(self._turns) > 1:
+            dropped = self._turns.pop(0)
+            total -= sum(self.counter.count_message(message) for message in dropped)
+            if dropped and dropped[0].get("role") == "user":
+                self._dropped_questions.append(dropped[0].get("content") or "")
+                total = self.token_count()
+        if total > self.token_budget:
+            # 只剩当前轮仍超出预算：压缩当前轮中除最后一批结果外的工具输出
+            current = self._turns[-1]
+            last_assistant = max(
+                (i for i, m in enumerate(current) if m.get("role") == "assistant"), default=len(current)
+            )
+            total = self._stub_messages(current[:last_assistant], total)
+        logging.info(f"Compacted conversation history from {before} to {total} tokens.")
@@ -1,25 +1,206 @@
+import json
 import logging
-from openai import OpenAI
+import time
+from typing import Any, Callable
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAIError
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from exceptions import LLMError
+from tracing import tracer
+
+class TokenUsage:
+    """Accumulates token usage reported by the LLM provider."""
+    def __init__(self) -> None:
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, usage: Any) -> None:
+        if usage is None:
+            return
+        self.prompt_tokens += usage.prompt_tokens or 0
+        self.completion_tokens += usage.completion_tokens or 0
+
+class ToolCallAssembler:
+    """Assembles streamed tool_call deltas into complete tool calls."""
+    def __init__(self) -> None:
+        self._calls: dict[int, dict[str, Any]] = {}
+        self._completed: set[int] = set()
+
+    @staticmethod
+    def _arguments_complete(arguments: str) -> bool:
+        # 参数是一个 JSON 对象，能完整解析即说明参数已经接收完毕
+        if not arguments.rstrip().endswith("}"):
+            return False
+        try:
+            json.loads(arguments)
+        except json.JSONDecodeError:
+            return False
+        return True
+
+    def _complete(self, index: int) -> ChatCompletionMessageToolCall:
+        self._completed.add(index)
+        return self._build(index)
+
+    def _build(self, index: int) -> ChatCompletionMessageToolCall:
+        call = self._calls[index]
+        return ChatCompletionMessageToolCall(
+            id=call["id"] or f"call_{index}",
+            type="function",
+            function=Function(name=call["name"], arguments="".join(call["arguments"])),
+        )
+
+    def add(self, delta: Any) -> list[ChatCompletionMessageToolCall]:
+        """Feed one tool_call delta; return the tool calls completed by it."""
+        completed = []
+        index = delta.index
+        if index not in self._calls:
+            # 新的调用开始，意味着之前的调用已经接收完毕
+            for previous in sorted(self._calls):
+                if previous not in self._completed:
+                    completed.append(self._complete(previous))
+            self._calls[index] = {"id": None, "name": "", "arguments": []}
+        call = self._calls[index]
+        if delta.id:
+            call["id"] = delta.id
+        if delta.function:
+            if delta.function.name:
+                call["name"] += delta.function.name
+            if delta.function.arguments:
+                call["arguments"].append(delta.function.arguments)
+        if (
+            index not in self._completed
+            and call["name"]
+            and self._arguments_complete("".join(call["arguments"]))
+        ):
+            completed.append(self._complete(index))
+        return completed
+
+    def finish(self) -> list[ChatCompletionMessageToolCall]:
+        """Complete all remaining tool calls at the end of the stream."""
+        return [self._complete(index) for index in sorted(self._calls) if index not in self._completed]
+
+    @property
+    def tool_calls(self) -> list[ChatCompletionMessageToolCall]:
+        return [self._build(index) for index in sorted(self._calls)]
 
 class LLMClient:
     """Manages communication with the LLM provider."""
-    def __init__(self, api_key: str, base_url: str) -> None:
-        self.llm_client = OpenAI(api_key=api_key, base_url=base_url)
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str,
+        model: str = "deepseek-chat",
+        temperature: float = 0.7,
+        max_tokens: int = 4096,
+        max_connections: int = 10,
+        max_keepalive_connections: int = 5,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
+    ) -> None:
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        # 共享的 HTTP 连接池，请求之间复用 keep-alive 连接
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+            ),
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+        self.llm_client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
 
-    def get_response(self, messages: list[dict[str, str]], available_tools: list[dict[str, any]] = None) -> str:
+    async def get_response(
+        self,
+        messages: list[dict[str, Any]],
+        available_tools: list[dict[str, Any]] | None = None,
+        usage: TokenUsage | None = None,
+    ) -> Any:
+        """Request a completion without blocking the event loop."""
         try:
-            response = self.llm_client.chat.completions.create(
-                model="deepseek-chat",       
-                messages=messages,
-                tools=available_tools if available_tools else None, # 可用的工具列表
-                temperature=0.7,
-                max_tokens=4096,
-            )
+            with tracer.span("llm.request", model=self.model, stream=False) as span:
+                response = await self.llm_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    tools=available_tools if available_tools else None, # 可用的工具列表
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                )
+                if response.usage:
+                    span.set(
+                        prompt_tokens=response.usage.prompt_tokens,
+                        completion_tokens=response.usage.completion_tokens,
+                    )
+            if usage is not None:
+                usage.add(response.usage)
             return response.choices[0].message
-        except Exception as e:
+        except OpenAIError as e:
+            error_message = f"Error getting LLM response: {str(e)}"
+            logging.error(error_message)
+            raise LLMError(error_message, e) from e
+
+    async def stream_response(
+        self,
+        messages: list[dict[str, Any]],
+        available_tools: list[dict[str, Any]] | None = None,
+        on_text: Callable[[str], None] | None = None,
+        on_tool_call: Callable[[ChatCompletionMessageToolCall], None] | None = None,
+        usage: TokenUsage | None = None,
+    ) -> ChatCompletionMessage:
+        """Stream a completion, reporting text deltas and tool calls as soon as they are complete."""
+        content_parts = []
+        assembler = ToolCallAssembler()
+        try:
+            with tracer.span("llm.request", model=self.model, stream=True) as span:
+                started = time.perf_counter()
+                stream = await self.llm_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    tools=available_tools if available_tools else None,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        span.set(
+                            prompt_tokens=chunk.usage.prompt_tokens,
+                            completion_tokens=chunk.usage.completion_tokens,
+                        )
+                        if usage is not None:
+                            usage.add(chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if "first_token_ms" not in span.attributes and (delta.content or delta.tool_calls):
+                        span.set(first_token_ms=round((time.perf_counter() - started) * 1000, 3))
+                    if delta.content:
+                        content_parts.append(delta.content)
+                        if on_text:
+                            on_text(delta.content)
+                    for tool_call_delta in delta.tool_calls or []:
+                        for tool_call in assembler.add(tool_call_delta):
+                            if on_tool_call:
+                                on_tool_call(tool_call)
+                for tool_call in assembler.finish():
+                    if on_tool_call:
+                        on_tool_call(tool_call)
+        except OpenAIError as e:
             error_message = f"Error getting LLM response: {str(e)}"
             logging.error(error_message)
-            return (
-                f"I encountered an error: {error_message}. "
-                "Please try again or rephrase your request."
-            )
+            raise LLMError(error_message, e) from e
+        return ChatCompletionMessage(
+            role="assistant",
+            content="".join(content_parts) or None,
+            tool_calls=assembler.tool_calls or None,
+        )
+
+    async def aclose(self) -> None:
+        """Close the underlying HTTP connection pool."""
+        await self.llm_client.close()
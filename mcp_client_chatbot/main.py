@@ -1,8 +1,15 @@
+import argparse
 import asyncio
+import os
+from batch import BatchRunner
+from catalogue import ToolCatalogue
 from config import Configuration
-from server import Server
 from llm_client import LLMClient
+from result_store import ResultStore
+from server_pool import create_server
+from tool_cache import ToolResultCache
 from chat_session import ChatSession
+from tracing import tracer
 import logging
 
 logging.basicConfig(
@@ -13,16 +20,94 @@ logging.basicConfig(
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 
-async def main() -> None:
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="MCP client chatbot")
+    parser.add_argument(
+        "--trace",
+        default=os.getenv("TRACE_FILE"),
+        help="write timing spans to this JSONL file (default: $TRACE_FILE)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print per-span and per-tool latency percentiles at exit",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="PROMPTS_JSONL",
+        help="run the prompts in this JSONL file headlessly instead of the interactive loop",
+    )
+    parser.add_argument(
+        "--output",
+        help="batch results JSONL (default: <prompts>.results.jsonl)",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=positive_int,
+        help="number of batch conversations run at the same time (default: $BATCH_CONCURRENCY or 4)",
+    )
+    return parser.parse_args()
+
+async def main(args: argparse.Namespace) -> None:
+    tracer.configure(args.trace)
     config = Configuration()
     server_config = config.load_config("servers_config.json")
+    catalogue = ToolCatalogue(os.path.join(config.cache_dir, "tool_catalogue.json"))
+    result_cache = ToolResultCache(config.tool_cache_max_bytes)
     servers = [
-        Server(name, srv_config)
+        create_server(name, srv_config, catalogue, result_cache)
         for name, srv_config in server_config["mcpServers"].items()
     ]
-    llm_client = LLMClient(config.api_key, config.base_url)
-    chat_session = ChatSession(servers, llm_client)
-    await chat_session.start()
+    llm_client = LLMClient(
+        config.api_key,
+        config.base_url,
+        model=config.llm_model,
+        temperature=config.llm_temperature,
+        max_tokens=config.llm_max_tokens,
+        max_connections=config.llm_max_connections,
+        max_keepalive_connections=config.llm_max_keepalive_connections,
+        connect_timeout=config.llm_connect_timeout,
+        read_timeout=config.llm_read_timeout,
+    )
+    chat_session = ChatSession(
+        servers,
+        llm_client,
+        startup_timeout=config.server_startup_timeout,
+        stream=config.llm_stream,
+        history_token_budget=config.history_token_budget,
+        result_store=ResultStore(
+            os.path.join(config.cache_dir, "results"),
+            threshold=config.result_spill_threshold,
+        ),
+        max_rounds=config.max_rounds,
+        turn_timeout=config.turn_timeout,
+        max_turn_tokens=config.max_turn_tokens,
+        tool_top_k=config.tool_top_k,
+        pinned_tools=config.pinned_tools,
+        tool_description_max_chars=config.tool_description_max_chars,
+        health_check_interval=config.health_check_interval,
+        ping_timeout=config.ping_timeout,
+        warm_start=config.warm_start,
+    )
+    try:
+        if args.batch:
+            output_path = args.output or os.path.splitext(args.batch)[0] + ".results.jsonl"
+            runner = BatchRunner(chat_session, args.concurrency or config.batch_concurrency)
+            await runner.run(args.batch, output_path)
+        else:
+            await chat_session.start()
+    finally:
+        await llm_client.aclose()
+        logging.info(f"Tool result cache: {result_cache.stats()}")
+        tracer.close()
+        if args.profile:
+            print(tracer.summary())
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import os
+import time
+from itertools import islice
+from typing import Any
+from tool import Tool
+
+class ResultStore:
+    """Content-addressed local store for large tool results, read back in pages."""
+    def __init__(
+        self,
+        directory: str,
+        threshold: int = 16384,
+        preview_lines: int = 20,
+        preview_chars: int = 2000,
+        max_page_chars: int = 16384,
+        max_age_days: float = 7.0,
+    ) -> None:
+        self.directory = directory
+        self.threshold = threshold
+        self.preview_lines = preview_lines
+        self.preview_chars = preview_chars
+        self.max_page_chars = max_page_chars
+        os.makedirs(directory, exist_ok=True)
+        self._prune(max_age_days * 86400)
+
+    def _prune(self, max_age: float) -> None:
+        """Remove stored results older than max_age seconds."""
+        cutoff = time.time() - max_age
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError as e:
+                logging.warning(f"Failed to prune stored result {entry.path}: {e}")
+
+    def _path(self, handle: str) -> str:
+        if not handle.isalnum():
+            raise ValueError(f"Invalid result handle: {handle}")
+        return os.path.join(self.directory, f"{handle}.txt")
+
+    def put(self, content: str) -> str:
+        """Store content and return its handle."""
+        data = content.encode("utf-8")
+        handle = hashlib.sha256(data).hexdigest()[:16]
+        path = self._path(handle)
+        if os.path.exists(path):
+            # 相同内容已存在，刷新时间避免被清理
+            os.utime(path)
+        else:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return handle
+
+    def spill(self, content: str) -> str:
+        """Return content unchanged if small, otherwise store it and return a preview with its handle."""
+        size = len(content.encode("utf-8"))
+        if size <= self.threshold:
+            return content
+        handle = self.put(content)
+        line_count = content.count("\n") + (0 if content.endswith("\n") else 1)
+        preview = "".join(islice(content.splitlines(keepends=True), self.preview_lines))
+        preview = preview[:self.preview_chars]
+        logging.info(f"Stored large tool result ({size} bytes) as {handle}.")
+        return (
+            f"[Large result stored with handle {handle}: {size} bytes, {line_count} lines. "
+            f"The first lines are shown below. Call read_tool_result with this handle and "
+            f"start_line/end_line (1-based, inclusive) or offset/length (bytes) to read more.]\n"
+            f"{preview}"
+        )
+
+    def read(
+        self,
+        handle: str,
+        start_line: int | None = None,
+        end_line: int | None = None,
+        offset: int | None = None,
+        length: int | None = None,
+    ) -> str:
+        """Read a line range or byte range of a stored result."""
+        path = self._path(handle)
+        if not os.path.exists(path):
+            return f"Error: No stored result with handle {handle}"
+        if offset is not None or length is not None:
+            if length is not None and length <= 0:
+                return f"Error: length must be a positive number of bytes, got {length}"
+            offset = max(offset or 0, 0)
+            length = min(length or self.max_page_chars, self.max_page_chars)
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read(length)
+            total = os.path.getsize(path)
+            return (
+                f"[Bytes {offset}-{offset + len(data)} of {total}]\n"
+                f"{data.decode('utf-8', errors='replace')}"
+            )
+        start_line = max(start_line or 1, 1)
+        end_line = end_line or start_line + self.preview_lines * 5 - 1
+        lines = []
+        size = 0
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in islice(f, start_line - 1, end_line):
+                size += len(line)
+                if size > self.max_page_chars and lines:
+                    break
+                lines.append(line)
+        if not lines:
+            return f"[No lines at {start_line}-{end_line}]"
+        last_line = start_line + len(lines) - 1
+        return f"[Lines {start_line}-{last_line}]\n{''.join(lines)}"
+
+    def as_tool(self) -> Tool:
+        """Describe the built-in tool that reads stored results."""
+        return Tool(
+            "read_tool_result",
+            "Read part of a large tool result that was stored with a handle. "
+            "Use start_line/end_line for line ranges or offset/length for byte ranges.",
+            {
+                "type": "object",
+                "properties": {
+                    "handle": {"type": "string", "description": "Handle of the stored result"},
+                    "start_line": {"type": "integer", "description": "First line to read (1-based)"},
+                    "end_line": {"type": "integer", "description": "Last line to read (inclusive)"},
+                    "offset": {"type": "integer", "description": "Byte offset to start reading from"},
+                    "length": {"type": "integer", "description": "Number of bytes to read"},
+                },
+                "required": ["handle"],
+            },
+        )
+
+    async def call_tool(self, arguments: dict[str, Any]) -> str:
+        """Execute the read_tool_result tool."""
+        return self.read(
+            arguments["handle"],
+            start_line=arguments.get("start_line"),
+            end_line=arguments.get("end_line"),
+            offset=arguments.get("offset"),
+            length=arguments.get("length"),
+        )
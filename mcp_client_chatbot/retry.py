@@ -0,0 +1,72 @@
+import logging
+import random
+import time
+import anyio
+from mcp.shared.exceptions import McpError
+from exceptions import ServerUnavailableError
+
+# 连接已关闭时 MCP 会话返回的错误码（旧版本 mcp 中没有该常量）
+_CONNECTION_CLOSED = -32000
+
+def backoff_delay(attempt: int, base: float, cap: float = 30.0) -> float:
+    """Exponential backoff with full jitter for the given 1-based attempt."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Whether a failed call may succeed when retried (transport or process failures).
+
+    Errors reported by the server itself (unknown tool, invalid arguments) are not
+    transient: retrying them only repeats the same failure.
+    """
+    if isinstance(error, McpError):
+        return error.error.code == _CONNECTION_CLOSED
+    return isinstance(
+        error,
+        (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream, OSError),
+    )
+
+
+class CircuitBreaker:
+    """Fails calls fast after repeated failures, letting one trial call through after reset_timeout."""
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def check(self) -> None:
+        """Raise ServerUnavailableError while the breaker is open."""
+        state = self.state
+        if state == "open":
+            retry_after = self.reset_timeout - (time.monotonic() - self._opened_at)
+            raise ServerUnavailableError(self.name, retry_after)
+        if state == "half_open":
+            # 半开状态只放行一个试探调用，其余调用在其结束前继续快速失败
+            logging.info(f"Circuit for server {self.name} is half-open, trying one call.")
+            self._opened_at = time.monotonic()
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logging.info(f"Circuit for server {self.name} closed.")
+        self.failures = 0
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            if self._opened_at is None:
+                logging.error(
+                    f"Circuit for server {self.name} opened after {self.failures} failures, "
+                    f"failing fast for {self.reset_timeout} seconds."
+                )
+            self._opened_at = time.monotonic()
@@ -3,52 +3,206 @@ import logging
 import os
 import shutil
 from contextlib import AsyncExitStack
-from typing import Any, List
-from mcp import ClientSession, StdioServerParameters
+from typing import Any, AsyncContextManager, List
+from mcp import ClientSession, StdioServerParameters, types
+from mcp.client.sse import sse_client
 from mcp.client.stdio import stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from catalogue import ToolCatalogue
+from exceptions import ToolTimeoutError
+from retry import CircuitBreaker, backoff_delay, is_transient_error
 from tool import Tool
+from tool_cache import ToolResultCache
+from tracing import tracer
 
 class Server:
     """Manages MCP server connections and tool execution."""
-    def __init__(self, name: str, config: dict[str, Any]) -> None:
+    def __init__(
+        self,
+        name: str,
+        config: dict[str, Any],
+        catalogue: ToolCatalogue | None = None,
+        result_cache: ToolResultCache | None = None,
+    ) -> None:
         self.name = name
         self.config = config
-        self.stdio_context: Any | None = None
         self.session: ClientSession | None = None
+        self._init_lock: asyncio.Lock = asyncio.Lock()
         self._cleanup_lock: asyncio.Lock = asyncio.Lock()
-        self.exit_stack: AsyncExitStack = AsyncExitStack()
+        # 连接由独立任务持有：anyio 要求 stdio_client 的上下文在同一任务中进入和退出，
+        # 这样并发启动、懒启动和清理可以发生在任意任务里
+        self._connection_task: asyncio.Task | None = None
+        self._shutdown: asyncio.Event = asyncio.Event()
+        # 懒启动：仅在首次有工具调用路由到该服务器时才启动进程；
+        # 热启动：进程在后台连接。两种情况下连接前都使用工具目录中缓存的工具列表
+        self.catalogue = catalogue
+        self.lazy: bool = bool(config.get("lazy", False))
+        self.cached_tools: list[Tool] | None = catalogue.get(name, config) if catalogue else None
+        self._warm_start_task: asyncio.Task | None = None
+        # 工具列表版本号：初始化（重连）成功或收到 tools/list_changed 通知时递增，
+        # ChatSession 据此判断是否需要重建工具路由表
+        self.tools_version: int = 0
+        # 幂等工具的结果缓存，按 servers_config.json 中的 cache 配置逐个工具开启
+        self.result_cache = result_cache
+        cache_config = config.get("cache", {})
+        self._cached_tools: set[str] = set(cache_config.get("tools", []))
+        self._cache_ttl: float = cache_config.get("ttl", 300)
+        if result_cache and cache_config.get("invalidatedBy"):
+            result_cache.register_invalidation(name, cache_config["invalidatedBy"])
+        # 限制对单个服务器的并发工具调用数，避免 stdio 服务器被大量请求淹没
+        self._call_semaphore: asyncio.Semaphore = asyncio.Semaphore(
+            config.get("maxConcurrency", 4)
+        )
+        # 单个工具调用的超时（秒），"*" 为该服务器的默认值；未配置则不限时
+        self._tool_timeouts: dict[str, float] = config.get("toolTimeouts", {})
+        # 连续失败达到阈值后熔断，在 resetTimeout 秒内直接失败，之后放行一个试探调用
+        breaker_config = config.get("circuitBreaker", {})
+        self.circuit_breaker = CircuitBreaker(
+            name,
+            failure_threshold=breaker_config.get("failureThreshold", 5),
+            reset_timeout=breaker_config.get("resetTimeout", 30.0),
+        )
+        self._restart_lock: asyncio.Lock = asyncio.Lock()
 
-    async def initialize(self) -> None:
-        """Initialize the server connection."""
+    async def _handle_message(self, message: Any) -> None:
+        """Handle incoming server messages, tracking tool list changes."""
+        if isinstance(message, types.ServerNotification) and isinstance(
+            message.root, types.ToolListChangedNotification
+        ):
+            logging.info(f"Server {self.name} reported a tool list change.")
+            self.tools_version += 1
+
+    @property
+    def can_start_lazily(self) -> bool:
+        """Whether the server can stay stopped until its first tool call."""
+        return self.lazy and self.cached_tools is not None
+
+    @property
+    def replicas(self) -> list["Server"]:
+        """The processes behind this server name; a plain server is its only replica."""
+        return [self]
+
+    @property
+    def is_connecting(self) -> bool:
+        """Whether a connection attempt is still in progress."""
+        task = self._connection_task
+        return self.session is None and task is not None and not task.done()
+
+    @property
+    def is_warm_starting(self) -> bool:
+        """Whether a background start is connecting while the cached catalogue is served."""
+        task = self._warm_start_task
+        return task is not None and not task.done()
+
+    @property
+    def has_tools(self) -> bool:
+        """Whether list_tools can be answered (connected, or catalogued and lazy or warm starting)."""
+        return self.session is not None or self._serves_cached_tools
+
+    @property
+    def _serves_cached_tools(self) -> bool:
+        return self.cached_tools is not None and (self.lazy or self.is_warm_starting)
+
+    def start_in_background(self, timeout: float | None = None) -> None:
+        """Connect in a background task, then verify the cached catalogue against the live tool list."""
+        if self._warm_start_task is None or self._warm_start_task.done():
+            self._warm_start_task = asyncio.create_task(self._warm_start(timeout))
+
+    async def _warm_start(self, timeout: float | None) -> None:
+        cached = self.cached_tools
+        try:
+            await asyncio.wait_for(self.initialize(), timeout)
+            tools = await self.list_tools()
+        except asyncio.TimeoutError:
+            logging.error(
+                f"MCP server {self.name} did not start within {timeout} seconds, "
+                f"dropping its cached tools."
+            )
+            return
+        except Exception as e:
+            # 启动失败后 has_tools 变为 False，下次刷新路由时移除其缓存的工具
+            logging.error(f"Failed to initialize MCP server {self.name}: {e}")
+            return
+        if cached is not None and [t.format_raw() for t in cached] != [t.format_raw() for t in tools]:
+            logging.info(f"MCP server {self.name} tool list changed, catalogue refreshed.")
+        else:
+            logging.info(f"MCP server {self.name} initialized, cached catalogue verified.")
+
+    def _transport(self) -> AsyncContextManager:
+        """Open the configured transport: a stdio subprocess, or SSE / streamable HTTP for a url."""
+        url = self.config.get("url")
+        if url:
+            # 未指定 transport 时使用 SSE：本仓库的服务器只提供 SSE，streamable HTTP 需显式指定
+            transport = self.config.get("transport") or "sse"
+            headers = self.config.get("headers")
+            if transport == "sse":
+                return sse_client(url, headers=headers)
+            if transport == "streamable-http":
+                return streamablehttp_client(url, headers=headers)
+            raise ValueError(f"Unknown transport {transport!r} for server {self.name}.")
         command = shutil.which(self.config["command"]) or self.config["command"]
         if command is None:
             raise ValueError("The command must be a valid string and cannot be None.")
-
         server_params = StdioServerParameters(
             command=command,
             args=self.config["args"],
             env={**os.environ, **self.config["env"]} if self.config.get("env") else None,
         )
-        try:
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
+        return stdio_client(server_params)
+
+    async def initialize(self) -> None:
+        """Initialize the server connection."""
+        async with self._init_lock:
+            if self.session:
+                return
+            transport = self._transport()
+            ready: asyncio.Future = asyncio.get_running_loop().create_future()
+            self._shutdown = asyncio.Event()
+            self._connection_task = asyncio.create_task(
+                self._run_connection(transport, ready)
             )
-            await session.initialize()
-            self.session = session
+            try:
+                with tracer.span("server.init", server=self.name):
+                    await ready
+            except BaseException as e:
+                if not isinstance(e, asyncio.CancelledError):
+                    logging.error(f"Error initializing server {self.name}: {e}")
+                # 不取消后台启动任务：初始化可能正运行在其中
+                await self._close_connection()
+                raise
+
+    async def _run_connection(self, transport: AsyncContextManager, ready: asyncio.Future) -> None:
+        """Own the transport and session for the lifetime of the connection."""
+        try:
+            async with AsyncExitStack() as stack:
+                # streamable HTTP 额外返回获取会话 ID 的函数，这里只需要读写流
+                streams = await stack.enter_async_context(transport)
+                read, write = streams[0], streams[1]
+                session = await stack.enter_async_context(
+                    ClientSession(read, write, message_handler=self._handle_message)
+                )
+                await session.initialize()
+                self.session = session
+                self.tools_version += 1
+                if not ready.done():
+                    ready.set_result(None)
+                await self._shutdown.wait()
         except Exception as e:
-            logging.error(f"Error initializing server {self.name}: {e}")
-            await self.cleanup()
-            raise
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                logging.error(f"Connection to server {self.name} closed with error: {e}")
+        finally:
+            self.session = None
 
     async def list_tools(self) -> List[Any]:
         """List available tools from the server."""
+        if not self.session and self._serves_cached_tools:
+            return list(self.cached_tools)
         if not self.session:
             raise RuntimeError(f"Server {self.name} not initialized")
-        tools_response = await self.session.list_tools()
+        with tracer.span("server.list_tools", server=self.name):
+            tools_response = await self.session.list_tools()
         tools = []
         for item in tools_response:
             if isinstance(item, tuple) and item[0] == "tools":
@@ -56,6 +210,9 @@ class Server:
                     #debug for print
                     #logging.info(f"tool.name {tool.name}...")
                     tools.append(Tool(tool.name, tool.description, tool.inputSchema))
+        if self.catalogue:
+            self.catalogue.update(self.name, self.config, tools)
+        self.cached_tools = tools
         return tools
 
     async def execute_tool(
@@ -65,33 +222,139 @@ class Server:
         retries: int = 2,
         delay: float = 1.0,
     ) -> Any:
-        """Execute a tool with retry mechanism."""
-        if not self.session:
-            raise RuntimeError(f"Server {self.name} not initialized")
+        """Execute a tool, serving cacheable tools from the result cache."""
+        cache = self.result_cache
+        if cache is None:
+            return await self._call_tool(tool_name, arguments, retries, delay)
+        cacheable = tool_name in self._cached_tools
+        if cacheable:
+            key = cache.make_key(self.name, tool_name, arguments)
+            cached = cache.get(key)
+            if cached is not None:
+                span = tracer.current_span()
+                if span:
+                    span.set(cached=True)
+                logging.info(
+                    f"Cache hit for {tool_name} on {self.name} "
+                    f"({cache.hits} hits, {cache.misses} misses)."
+                )
+                return cached
+            generation = cache.generation
+        try:
+            result = await self._call_tool(tool_name, arguments, retries, delay)
+        finally:
+            cache.notify_tool_call(tool_name)
+        if cacheable and not result.isError and cache.generation == generation:
+            cache.put(key, self.name, result, len(result.model_dump_json()), self._cache_ttl)
+        return result
+
+    def _tool_timeout(self, tool_name: str) -> float | None:
+        return self._tool_timeouts.get(tool_name, self._tool_timeouts.get("*"))
+
+    async def _call_tool(
+        self,
+        tool_name: str,
+        arguments: dict[str, Any],
+        retries: int,
+        delay: float,
+    ) -> Any:
+        """Execute a tool, retrying transient failures with exponential backoff and jitter."""
+        self.circuit_breaker.check()
+        timeout = self._tool_timeout(tool_name)
         attempt = 0
-        while attempt < retries:
+        while True:
+            session = self.session
             try:
+                if session is None:
+                    # 懒启动服务器首次调用，或进程崩溃后重新连接
+                    if self.lazy:
+                        logging.info(f"Starting lazy MCP server {self.name} for {tool_name}...")
+                    await self.initialize()
+                    session = self.session
                 logging.info(f"Executing {tool_name}...")
-                result = await self.session.call_tool(tool_name, arguments)
+                async with self._call_semaphore:
+                    # 单独计时 MCP 往返，便于区分客户端调度开销
+                    with tracer.span("mcp.call_tool", server=self.name):
+                        result = await asyncio.wait_for(
+                            session.call_tool(tool_name, arguments), timeout
+                        )
+                self.circuit_breaker.record_success()
                 return result
+            except asyncio.TimeoutError:
+                # 超时不重试：调用可能仍在服务器端执行，重复执行非幂等工具有风险
+                self.circuit_breaker.record_failure()
+                raise ToolTimeoutError(tool_name, timeout) from None
             except Exception as e:
                 attempt += 1
+                span = tracer.current_span()
+                if span:
+                    span.set(retries=attempt)
+                if not is_transient_error(e):
+                    logging.warning(f"Error executing tool {tool_name}: {e}. Not retrying.")
+                    raise
                 logging.warning(
                     f"Error executing tool: {e}. Attempt {attempt} of {retries}."
                 )
-                if attempt < retries:
-                    logging.info(f"Retrying in {delay} seconds...")
-                    await asyncio.sleep(delay)
-                else:
+                if attempt >= retries:
                     logging.error("Max retries reached. Failing.")
+                    self.circuit_breaker.record_failure()
                     raise
+                if session is not None and not await self.ping():
+                    # 连接已失效：重启进程后再重试
+                    try:
+                        await self.restart(session)
+                    except Exception as restart_error:
+                        logging.error(f"Failed to restart server {self.name}: {restart_error}")
+                wait = backoff_delay(attempt, delay)
+                logging.info(f"Retrying in {wait:.2f} seconds...")
+                await asyncio.sleep(wait)
+
+    async def ping(self, timeout: float = 10.0) -> bool:
+        """Check that the server still answers requests."""
+        session = self.session
+        if session is None:
+            return False
+        try:
+            await asyncio.wait_for(session.send_ping(), timeout)
+            return True
+        except Exception as e:
+            logging.warning(f"Ping to server {self.name} failed: {e!r}")
+            return False
+
+    async def restart(self, failed_session: ClientSession | None = None) -> None:
+        """Restart the server process; the new connection bumps tools_version to re-sync tools.
+
+        Does nothing if the server was already reconnected since failed_session was observed.
+        """
+        async with self._restart_lock:
+            if self.session is not None and self.session is not failed_session:
+                return
+            logging.warning(f"Restarting MCP server {self.name}...")
+            await self._close_connection()
+            await self.initialize()
+            logging.info(f"MCP server {self.name} restarted.")
 
     async def cleanup(self) -> None:
         """Clean up server resources."""
+        warm_start, self._warm_start_task = self._warm_start_task, None
+        if warm_start is not None and not warm_start.done():
+            warm_start.cancel()
+            await asyncio.gather(warm_start, return_exceptions=True)
+        await self._close_connection()
+
+    async def _close_connection(self) -> None:
         async with self._cleanup_lock:
+            task = self._connection_task
+            if task is None:
+                return
+            self._connection_task = None
             try:
-                await self.exit_stack.aclose()
-                self.session = None
-                self.stdio_context = None
+                if self.session is None:
+                    # 仍在连接过程中，直接取消连接任务
+                    task.cancel()
+                self._shutdown.set()
+                await asyncio.gather(task, return_exceptions=True)
             except Exception as e:
                 logging.error(f"Error during cleanup of server {self.name}: {e}")
+            finally:
+                self.session = None
@@ -0,0 +1,158 @@
+import asyncio
+import contextvars
+import logging
+from collections import OrderedDict
+from typing import Any, List
+from mcp import ClientSession
+from catalogue import ToolCatalogue
+from server import Server
+from tool import Tool
+from tool_cache import ToolResultCache
+
+# 当前对话的标识，由 ChatSession.run_turn 设置，供粘性路由使用
+current_conversation: contextvars.ContextVar[str | None] = contextvars.ContextVar(
+    "current_conversation", default=None
+)
+# 粘性路由最多记住的对话数，超出后淘汰最久未使用的
+_MAX_STICKY_CONVERSATIONS = 1024
+
+class ServerPool:
+    """Several identical server processes behind one server name.
+
+    Calls go to the replica with the fewest outstanding requests, or, with
+    "sticky": true, to the replica the conversation used before, so stateful
+    servers keep their state per conversation.
+    """
+    def __init__(
+        self,
+        name: str,
+        config: dict[str, Any],
+        catalogue: ToolCatalogue | None = None,
+        result_cache: ToolResultCache | None = None,
+    ) -> None:
+        self.name = name
+        self.config = config
+        # 副本共用同一服务器名，因此共享结果缓存和工具目录
+        self.replicas: list[Server] = [
+            Server(name, config, catalogue, result_cache)
+            for _ in range(max(config.get("replicas", 1), 1))
+        ]
+        self.sticky: bool = bool(config.get("sticky", False))
+        self._outstanding: list[int] = [0] * len(self.replicas)
+        self._sticky_routes: OrderedDict[str, int] = OrderedDict()
+        self._next_replica = 0
+
+    @property
+    def session(self) -> ClientSession | None:
+        """Session of the first connected replica, if any."""
+        return next((r.session for r in self.replicas if r.session is not None), None)
+
+    @property
+    def lazy(self) -> bool:
+        return self.replicas[0].lazy
+
+    @property
+    def can_start_lazily(self) -> bool:
+        return self.replicas[0].can_start_lazily
+
+    @property
+    def cached_tools(self) -> list[Tool] | None:
+        return self.replicas[0].cached_tools
+
+    @property
+    def has_tools(self) -> bool:
+        return any(replica.has_tools for replica in self.replicas)
+
+    @property
+    def tools_version(self) -> int:
+        # 任一副本重连或收到工具变更通知都会使总和增加
+        return sum(replica.tools_version for replica in self.replicas)
+
+    async def initialize(self) -> None:
+        """Start all replicas concurrently; the pool is usable if at least one starts."""
+        results = await asyncio.gather(
+            *(replica.initialize() for replica in self.replicas), return_exceptions=True
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if len(errors) == len(self.replicas):
+            raise errors[0]
+        if errors:
+            logging.warning(
+                f"{len(errors)} of {len(self.replicas)} replicas of {self.name} failed to start: {errors[0]}"
+            )
+        logging.info(f"Server pool {self.name} running {len(self.replicas) - len(errors)} replicas.")
+
+    def start_in_background(self, timeout: float | None = None) -> None:
+        """Start every replica in the background while the cached catalogue is served."""
+        for replica in self.replicas:
+            replica.start_in_background(timeout)
+
+    async def list_tools(self) -> List[Any]:
+        replica = next((r for r in self.replicas if r.session is not None), None)
+        if replica is None:
+            replica = next(r for r in self.replicas if r.has_tools)
+        return await replica.list_tools()
+
+    def _pick_replica(self) -> int:
+        """Index of the replica with the fewest outstanding calls.
+
+        Ties prefer healthy, already connected replicas, then rotate so idle
+        replicas share the load.
+        """
+        count = len(self.replicas)
+        start = self._next_replica
+        self._next_replica = (start + 1) % count
+        order = [(start + offset) % count for offset in range(count)]
+        return min(
+            order,
+            key=lambda i: (
+                self.replicas[i].circuit_breaker.state == "open",
+                self._outstanding[i],
+                self.replicas[i].session is None,
+            ),
+        )
+
+    def _sticky_replica(self, conversation: str) -> int:
+        index = self._sticky_routes.get(conversation)
+        if index is None:
+            index = self._pick_replica()
+            self._sticky_routes[conversation] = index
+            if len(self._sticky_routes) > _MAX_STICKY_CONVERSATIONS:
+                self._sticky_routes.popitem(last=False)
+        else:
+            self._sticky_routes.move_to_end(conversation)
+        return index
+
+    async def execute_tool(
+        self,
+        tool_name: str,
+        arguments: dict[str, Any],
+        retries: int = 2,
+        delay: float = 1.0,
+    ) -> Any:
+        """Execute a tool on the chosen replica."""
+        conversation = current_conversation.get()
+        if self.sticky and conversation is not None:
+            index = self._sticky_replica(conversation)
+        else:
+            index = self._pick_replica()
+        self._outstanding[index] += 1
+        try:
+            return await self.replicas[index].execute_tool(tool_name, arguments, retries, delay)
+        finally:
+            self._outstanding[index] -= 1
+
+    async def cleanup(self) -> None:
+        await asyncio.gather(*(replica.cleanup() for replica in self.replicas))
+
+
+def create_server(
+    name: str,
+    config: dict[str, Any],
+    catalogue: ToolCatalogue | None = None,
+    result_cache: ToolResultCache | None = None,
+) -> Server | ServerPool:
+    """Build a Server, or a ServerPool when the config asks for several replicas."""
+    if config.get("replicas", 1) > 1:
+        return ServerPool(name, config, catalogue, result_cache)
+    return Server(name, config, catalogue, result_cache)
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+from retry import backoff_delay
+from server import Server
+from server_pool import ServerPool
+
+class ServerSupervisor:
+    """Pings running servers periodically and restarts the ones that stopped responding."""
+    def __init__(
+        self,
+        servers: list[Server | ServerPool],
+        interval: float = 30.0,
+        ping_timeout: float = 10.0,
+        max_backoff: float = 300.0,
+    ) -> None:
+        # 副本池中的每个进程单独检查和重启
+        self.servers = [replica for server in servers for replica in server.replicas]
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self.max_backoff = max_backoff
+        # 只监管曾经连接成功的服务器（未启动的懒启动服务器和启动失败的服务器不在其列）；
+        # 以 Server 对象为键，因为同一副本池中的进程共用服务器名
+        self._supervised: set[Server] = set()
+        self._restart_failures: dict[Server, int] = {}
+        self._next_restart: dict[Server, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        """Start the background health check loop (disabled when interval <= 0)."""
+        if self.interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.gather(*(self.check(server) for server in self.servers))
+
+    async def check(self, server: Server) -> None:
+        """Ping a server and restart it, with backoff, if it is unresponsive or gone."""
+        session = server.session
+        if session is not None:
+            self._supervised.add(server)
+            if await server.ping(self.ping_timeout):
+                return
+        elif server not in self._supervised or server.is_connecting:
+            return
+        if time.monotonic() < self._next_restart.get(server, 0.0):
+            return
+        try:
+            await server.restart(session)
+        except Exception as e:
+            failures = self._restart_failures.get(server, 0) + 1
+            self._restart_failures[server] = failures
+            # 重启失败按指数退避（带抖动）推迟下一次尝试，同时计入熔断器
+            wait = self.interval + backoff_delay(failures, self.interval, self.max_backoff)
+            self._next_restart[server] = time.monotonic() + wait
+            server.circuit_breaker.record_failure()
+            logging.error(
+                f"Failed to restart MCP server {server.name} (attempt {failures}): {e}. "
+                f"Next attempt in {wait:.0f} seconds."
+            )
+            return
+        self._restart_failures.pop(server, None)
+        self._next_restart.pop(server, None)
@@ -1,19 +1,102 @@
+import re
 from typing import Any, Dict
 
+# 描述中的示例段落标题，如 "[调用示例]"、"Examples:"
+_EXAMPLE_HEADER = re.compile(r"^\s*(\[[^\]]*示例[^\]]*\]|examples?\s*[:：]|示例\s*[:：])", re.IGNORECASE)
+_SECTION_HEADER = re.compile(r"^\s*\[[^\]]+\]\s*$")
+_CODE_BLOCK = re.compile(r"```.*?```", re.DOTALL)
+_SPACES = re.compile(r"[ \t]+")
+# 对 LLM 无用或冗余的 schema 字段
+_DROPPED_SCHEMA_KEYS = {"title", "examples", "example"}
+
+def compact_description(description: str | None, max_chars: int = 1500) -> str:
+    """Strip examples and redundant whitespace from a tool description and cap its length."""
+    if not description:
+        return ""
+    text = _CODE_BLOCK.sub("", description)
+    lines = []
+    in_example = False
+    for line in text.splitlines():
+        if _EXAMPLE_HEADER.match(line):
+            in_example = True
+            continue
+        if in_example and _SECTION_HEADER.match(line):
+            in_example = False
+        if in_example:
+            continue
+        line = _SPACES.sub(" ", line).strip()
+        if line:
+            lines.append(line)
+    text = "\n".join(lines)
+    if len(text) > max_chars:
+        text = text[:max_chars - 1].rstrip() + "…"
+    return text
+
+
+def _normalize(text: str) -> str:
+    return _SPACES.sub(" ", text).strip()
+
+
+def compact_schema(schema: Any, description: str = "") -> Any:
+    """Drop redundant schema fields and sort keys so the serialized schema is stable."""
+    if isinstance(schema, dict):
+        compacted = {}
+        for key in sorted(schema):
+            if key in _DROPPED_SCHEMA_KEYS:
+                continue
+            value = schema[key]
+            if key == "description" and isinstance(value, str):
+                value = _normalize(value)
+                # 参数说明与工具描述相同时去重；只是描述的一部分时仍可能是模型需要的信息，保留
+                if not value or value.casefold() == description.casefold():
+                    continue
+            elif key == "required" and isinstance(value, list):
+                value = sorted(value)
+            elif key == "properties" and isinstance(value, dict):
+                value = {name: compact_schema(value[name], description) for name in sorted(value)}
+            else:
+                value = compact_schema(value, description)
+            compacted[key] = value
+        return compacted
+    if isinstance(schema, list):
+        return [compact_schema(item, description) for item in schema]
+    return schema
+
+
 class Tool:
     """Represents a tool with its properties and formatting."""
-    def __init__(self, name: str, description: str, input_schema: Dict[str, Any]) -> None:
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        input_schema: Dict[str, Any],
+    ) -> None:
         self.name = name
         self.description = description
         self.input_schema = input_schema
+        self._formatted: tuple[int, Dict[str, Any]] | None = None
 
-    def format_for_llm(self) -> str:
-        """Format tool information for LLM."""
+    def format_raw(self) -> Dict[str, Any]:
+        """Format tool information exactly as received from the server."""
         return {
             "type": "function",
             "function": {
-                "name": self.name,              
-                "description": self.description,  
+                "name": self.name,
+                "description": self.description,
                 "parameters": self.input_schema
             }
         }
+
+    def format_for_llm(self, max_description_chars: int = 1500) -> Dict[str, Any]:
+        """Format compacted, deterministically ordered tool information for LLM."""
+        if self._formatted is None or self._formatted[0] != max_description_chars:
+            description = compact_description(self.description, max_description_chars)
+            self._formatted = (max_description_chars, {
+                "type": "function",
+                "function": {
+                    "name": self.name,
+                    "description": description,
+                    "parameters": compact_schema(self.input_schema or {}, _normalize(description)),
+                }
+            })
+        return self._formatted[1]
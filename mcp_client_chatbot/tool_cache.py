@@ -0,0 +1,82 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any
+
+class ToolResultCache:
+    """LRU cache of tool results bounded by total size, with per-entry TTL."""
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024) -> None:
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        # key -> (server_name, expires_at, size, result)
+        self._entries: OrderedDict[str, tuple[str, float, int, Any]] = OrderedDict()
+        # 变更类工具名 -> 需要在其执行后失效的服务器名
+        self._invalidated_by: dict[str, set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # 每次失效递增；调用开始后若发生过失效，则其结果不再写入缓存
+        self.generation = 0
+
+    @staticmethod
+    def make_key(server_name: str, tool_name: str, arguments: dict[str, Any]) -> str:
+        """Build a cache key from the tool name and canonicalized arguments."""
+        canonical = json.dumps(arguments, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return f"{server_name}\x00{tool_name}\x00{canonical}"
+
+    def register_invalidation(self, server_name: str, tool_names: list[str]) -> None:
+        """Drop the server's entries whenever one of the given tools runs on any server."""
+        for tool_name in tool_names:
+            self._invalidated_by.setdefault(tool_name, set()).add(server_name)
+
+    def get(self, key: str) -> Any | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        _, expires_at, size, result = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, key: str, server_name: str, result: Any, size: int, ttl: float) -> None:
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (server_name, time.monotonic() + ttl, size, result)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key: str) -> None:
+        _, _, size, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def notify_tool_call(self, tool_name: str) -> None:
+        """Invalidate entries of servers that registered tool_name as mutating."""
+        server_names = self._invalidated_by.get(tool_name)
+        if not server_names:
+            return
+        self.generation += 1
+        stale = [key for key, entry in self._entries.items() if entry[0] in server_names]
+        for key in stale:
+            self._remove(key)
+        if stale:
+            self.invalidations += len(stale)
+            logging.info(f"{tool_name} invalidated {len(stale)} cached tool results.")
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+        }
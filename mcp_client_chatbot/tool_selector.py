@@ -0,0 +1,95 @@
+import math
+import re
+from collections import Counter
+from typing import Any
+from tool import Tool
+
+_WORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Za-z][a-z]*|\d+")
+_CJK_PATTERN = re.compile(r"[㐀-䶿一-鿿]+")
+
+def tokenize(text: str | None) -> list[str]:
+    """Split text into lowercase terms: words (snake/camel case split) and CJK bigrams."""
+    if not text:
+        return []
+    terms = [word.lower() for word in _WORD_PATTERN.findall(text)]
+    for run in _CJK_PATTERN.findall(text):
+        # 中文没有空格分词，使用单字加相邻二元组
+        terms.extend(run)
+        terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return terms
+
+
+def _parameter_text(schema: dict[str, Any]) -> str:
+    """Collect parameter names and descriptions from a JSON schema."""
+    parts = []
+    for name, prop in (schema or {}).get("properties", {}).items():
+        parts.append(name)
+        if isinstance(prop, dict):
+            parts.append(prop.get("description") or "")
+            parts.append(_parameter_text(prop))
+    return " ".join(parts)
+
+
+class ToolSelector:
+    """Picks the tools most relevant to a query using a local BM25 index."""
+    def __init__(
+        self,
+        tools: list[Tool],
+        top_k: int = 12,
+        pinned: list[str] | None = None,
+        k1: float = 1.5,
+        b: float = 0.75,
+    ) -> None:
+        self.tools = tools
+        self.top_k = top_k
+        self.pinned = set(pinned or [])
+        self.k1 = k1
+        self.b = b
+        self._documents: list[Counter] = []
+        for tool in tools:
+            # 工具名权重更高，重复计入三次
+            terms = tokenize(tool.name) * 3
+            terms += tokenize(tool.description)
+            terms += tokenize(_parameter_text(tool.input_schema))
+            self._documents.append(Counter(terms))
+        self._lengths = [sum(doc.values()) for doc in self._documents]
+        self._average_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        document_frequency = Counter(term for doc in self._documents for term in doc)
+        count = len(self._documents)
+        self._idf = {
+            term: math.log(1 + (count - freq + 0.5) / (freq + 0.5))
+            for term, freq in document_frequency.items()
+        }
+
+    def score(self, query: str) -> list[float]:
+        """BM25 score of every tool for the query."""
+        terms = set(tokenize(query))
+        scores = []
+        for doc, length in zip(self._documents, self._lengths):
+            score = 0.0
+            for term in terms:
+                freq = doc.get(term)
+                if not freq:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * length / (self._average_length or 1))
+                score += self._idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            scores.append(score)
+        return scores
+
+    def select(self, query: str) -> list[Tool]:
+        """Return the pinned tools plus the top-k matches, in their original order."""
+        if self.top_k <= 0 or len(self.tools) <= self.top_k:
+            return list(self.tools)
+        scores = self.score(query)
+        ranked = sorted(
+            (i for i, score in enumerate(scores) if score > 0),
+            key=lambda i: scores[i],
+            reverse=True,
+        )
+        chosen = set(ranked[:self.top_k])
+        chosen.update(i for i, tool in enumerate(self.tools) if tool.name in self.pinned)
+        if not ranked:
+            # 没有任何匹配时不做裁剪，避免模型无工具可用
+            return list(self.tools)
+        # 保持原有顺序，使请求前缀尽量稳定
+        return [tool for i, tool in enumerate(self.tools) if i in chosen]
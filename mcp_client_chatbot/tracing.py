@@ -0,0 +1,109 @@
+import contextvars
+import itertools
+import json
+import logging
+import math
+import os
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("current_span", default=None)
+_span_ids = itertools.count(1)
+
+class Span:
+    """A timed operation with attributes, nested under the span active when it started."""
+    def __init__(self, name: str, attributes: dict[str, Any]) -> None:
+        self.name = name
+        self.span_id = next(_span_ids)
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start_time,
+            "duration_ms": round(self.duration * 1000, 3),
+            **self.attributes,
+        }
+
+
+def _percentile(sorted_values: list[float], percent: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(math.ceil(percent / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class Tracer:
+    """Collects spans on the hot paths and optionally writes them to a JSONL trace file."""
+    def __init__(self) -> None:
+        self._file = None
+        self._durations: dict[str, list[float]] = {}
+
+    def configure(self, file_path: str | None) -> None:
+        """Start writing finished spans to file_path (JSONL, appended)."""
+        self.close()
+        if file_path:
+            directory = os.path.dirname(file_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(file_path, "a", encoding="utf-8")
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time the enclosed block as a span; exceptions are recorded and re-raised."""
+        span = Span(name, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span._started
+            self._record(span)
+
+    @staticmethod
+    def current_span() -> Span | None:
+        return _current_span.get()
+
+    def _record(self, span: Span) -> None:
+        # 工具调用按工具名分别统计，其余按 span 名称统计
+        key = f"tool.call:{span.attributes['tool']}" if span.name == "tool.call" else span.name
+        self._durations.setdefault(key, []).append(span.duration)
+        if self._file:
+            try:
+                self._file.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                self._file.flush()
+            except (OSError, ValueError) as e:
+                logging.warning(f"Failed to write trace span: {e}")
+
+    def summary(self) -> str:
+        """Per-span (and per-tool) latency percentiles in milliseconds."""
+        lines = [f"{'span':<40} {'count':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"]
+        for key in sorted(self._durations):
+            values = sorted(d * 1000 for d in self._durations[key])
+            lines.append(
+                f"{key:<40} {len(values):>6} {_percentile(values, 50):>9.1f} "
+                f"{_percentile(values, 90):>9.1f} {_percentile(values, 99):>9.1f} {values[-1]:>9.1f}"
+            )
+        return "\n".join(lines)
+
+
+# 全局 tracer，由 main.py 根据命令行参数配置输出文件
+tracer = Tracer()
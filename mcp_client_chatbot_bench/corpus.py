@@ -0,0 +1,47 @@
+import os
+import random
+
+# 语料中的关键词，场景脚本按这些词构造搜索请求
+KEYWORDS = ["timeout", "connection", "checksum", "配置", "异常"]
+_WORDS = [
+    "alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+    "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa",
+    "日志", "服务", "请求", "缓存", "文件", "进程",
+]
+_EXTENSIONS = [".txt", ".log", ".md", ".csv"]
+
+def generate_corpus(
+    directory: str,
+    files: int = 200,
+    lines_per_file: int = 200,
+    subdirectories: int = 10,
+    seed: int = 42,
+) -> str:
+    """Write a deterministic text corpus under directory and return its absolute path.
+
+    Generation is skipped when a corpus with the same parameters already exists.
+    """
+    directory = os.path.abspath(directory)
+    marker = os.path.join(directory, ".corpus")
+    signature = f"{files} {lines_per_file} {subdirectories} {seed}"
+    if os.path.exists(marker):
+        with open(marker, "r", encoding="utf-8") as f:
+            if f.read() == signature:
+                return directory
+    rng = random.Random(seed)
+    for index in range(files):
+        subdirectory = os.path.join(directory, f"dir_{index % subdirectories:02d}")
+        os.makedirs(subdirectory, exist_ok=True)
+        file_path = os.path.join(subdirectory, f"file_{index:04d}{_EXTENSIONS[index % len(_EXTENSIONS)]}")
+        lines = []
+        for line_number in range(lines_per_file):
+            words = rng.choices(_WORDS, k=rng.randint(6, 14))
+            # 约 2% 的行包含关键词，供内容搜索命中
+            if rng.random() < 0.02:
+                words.insert(rng.randrange(len(words)), rng.choice(KEYWORDS))
+            lines.append(f"{line_number:05d} " + " ".join(words))
+        with open(file_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    with open(marker, "w", encoding="utf-8") as f:
+        f.write(signature)
+    return directory
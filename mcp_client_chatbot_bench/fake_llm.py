@@ -0,0 +1,161 @@
+import asyncio
+import json
+import threading
+import time
+from typing import Any
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+class FakeLLMServer:
+    """Local OpenAI-compatible endpoint that replays scripted responses, including tool calls.
+
+    The script is a list of turns, each a list of responses. The turn is chosen by
+    the number of user messages in the request and the response by the number of
+    assistant messages after the last user message, so the server is stateless and
+    concurrent conversations replay independently.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0.0) -> None:
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.turns: list[list[dict[str, Any]]] = []
+        self.request_count = 0
+        self._server: uvicorn.Server | None = None
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def load_script(self, turns: list[list[dict[str, Any]]], latency_ms: float | None = None) -> None:
+        self.turns = turns
+        if latency_ms is not None:
+            self.latency_ms = latency_ms
+
+    def _pick_response(self, messages: list[dict[str, Any]]) -> dict[str, Any]:
+        user_indexes = [i for i, m in enumerate(messages) if m.get("role") == "user"]
+        turn_index = max(len(user_indexes) - 1, 0)
+        after_user = messages[user_indexes[-1] + 1:] if user_indexes else messages
+        step = sum(1 for m in after_user if m.get("role") == "assistant")
+        if turn_index >= len(self.turns) or not self.turns[turn_index]:
+            return {"content": "ok"}
+        responses = self.turns[turn_index]
+        return responses[min(step, len(responses) - 1)]
+
+    @staticmethod
+    def _usage(body: dict[str, Any], response: dict[str, Any]) -> dict[str, int]:
+        prompt_tokens = len(json.dumps(body.get("messages", []), ensure_ascii=False)) // 4
+        prompt_tokens += len(json.dumps(body.get("tools") or [], ensure_ascii=False)) // 4
+        completion_tokens = len(json.dumps(response, ensure_ascii=False)) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+
+    @staticmethod
+    def _tool_calls(response: dict[str, Any]) -> list[dict[str, Any]]:
+        return [
+            {
+                "id": f"call_{i}_{time.time_ns()}",
+                "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(call.get("arguments", {}))},
+            }
+            for i, call in enumerate(response.get("tool_calls", []))
+        ]
+
+    async def _completions(self, request: Request):
+        body = await request.json()
+        self.request_count += 1
+        response = self._pick_response(body.get("messages", []))
+        # 没有提供工具时（如预算耗尽后的收尾请求）只返回文本
+        if not body.get("tools") and response.get("tool_calls"):
+            response = {"content": "ok"}
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        usage = self._usage(body, response)
+        tool_calls = self._tool_calls(response)
+        if body.get("stream"):
+            return StreamingResponse(
+                self._stream(response, tool_calls, usage, body.get("stream_options") or {}),
+                media_type="text/event-stream",
+            )
+        message: dict[str, Any] = {"role": "assistant", "content": response.get("content")}
+        if tool_calls:
+            message["tool_calls"] = tool_calls
+        return JSONResponse({
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }],
+            "usage": usage,
+        })
+
+    async def _stream(self, response, tool_calls, usage, stream_options):
+        def chunk(delta: dict[str, Any], finish_reason: str | None = None, **extra: Any) -> str:
+            payload = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "fake",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        yield chunk({"role": "assistant"})
+        content = response.get("content") or ""
+        for start in range(0, len(content), 8):
+            yield chunk({"content": content[start:start + 8]})
+        for index, call in enumerate(tool_calls):
+            arguments = call["function"]["arguments"]
+            yield chunk({"tool_calls": [{
+                "index": index,
+                "id": call["id"],
+                "type": "function",
+                "function": {"name": call["function"]["name"], "arguments": ""},
+            }]})
+            # 参数分片发送，模拟真实流式输出
+            for start in range(0, len(arguments), 16):
+                yield chunk({"tool_calls": [{
+                    "index": index,
+                    "function": {"arguments": arguments[start:start + 16]},
+                }]})
+        yield chunk({}, "tool_calls" if tool_calls else "stop")
+        if stream_options.get("include_usage"):
+            payload = {
+                "id": "chatcmpl-bench",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "fake",
+                "choices": [],
+                "usage": usage,
+            }
+            yield f"data: {json.dumps(payload)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    def start(self) -> None:
+        """Serve in a background thread so the benchmark event loop is not shared."""
+        app = Starlette(routes=[Route("/v1/chat/completions", self._completions, methods=["POST"])])
+        config = uvicorn.Config(app, host=self.host, port=self.port, log_level="warning")
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        if not self.port:
+            self.port = self._server.servers[0].sockets[0].getsockname()[1]
+
+    def stop(self) -> None:
+        if self._server:
+            self._server.should_exit = True
+        if self._thread:
+            self._thread.join(timeout=5)
@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+# 客户端模块使用平铺导入（from server import Server），直接加入搜索路径
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "mcp_client_chatbot"))
+
+from chat_session import ChatSession
+from history import ConversationHistory
+from llm_client import LLMClient
+from server_pool import create_server
+from tool_cache import ToolResultCache
+from tracing import tracer
+from corpus import generate_corpus
+from fake_llm import FakeLLMServer
+
+# 参与基线比较的指标，均为越小越好，按多次重复的中位数汇总
+METRICS = [
+    "startup_ms",
+    "turn_p50_ms",
+    "turn_max_ms",
+    "llm_ms",
+    "tool_ms",
+    "dispatch_overhead_ms",
+    "peak_memory_kb",
+    "prompt_tokens",
+]
+# 计时类指标低于该绝对差值时不判定为回归，避免微小抖动误报
+_TIME_NOISE_MS = 2.0
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline benchmark for the MCP client chatbot")
+    parser.add_argument("--scenarios", default=os.path.join(BENCH_DIR, "scenarios.json"))
+    parser.add_argument("--scenario", action="append", help="run only the named scenario (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per scenario (median is reported)")
+    parser.add_argument(
+        "--launcher",
+        choices=["uv", "python"],
+        default="uv",
+        help="start stdio servers with 'uv run' or with the current Python interpreter",
+    )
+    parser.add_argument("--corpus-dir", default=os.path.join(BENCH_DIR, ".mcp_cache", "corpus"))
+    parser.add_argument("--corpus-files", type=int, default=200)
+    parser.add_argument("--corpus-lines", type=int, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated LLM latency per request")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"),
+                        help="baseline results to compare against (skipped if missing)")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed relative increase over the baseline before flagging a regression")
+    parser.add_argument("--verbose", action="store_true", help="show client INFO logs")
+    return parser.parse_args()
+
+
+def _substitute(value: Any, corpus: str) -> Any:
+    """Replace the {corpus} placeholder in all strings of a scripted value."""
+    if isinstance(value, str):
+        return value.replace("{corpus}", corpus)
+    if isinstance(value, list):
+        return [_substitute(item, corpus) for item in value]
+    if isinstance(value, dict):
+        return {key: _substitute(item, corpus) for key, item in value.items()}
+    return value
+
+
+def _server_config(definition: dict[str, Any], launcher: str) -> dict[str, Any]:
+    script = os.path.normpath(os.path.join(BENCH_DIR, definition["script"]))
+    config = {key: value for key, value in definition.items() if key != "script"}
+    if launcher == "uv":
+        config.update(command="uv", args=["run", script])
+    else:
+        config.update(command=sys.executable, args=[script])
+    return config
+
+
+def _dispatch_overheads(trace_path: str) -> list[float]:
+    """Per tool call: tool.call time not spent in the MCP round trip, in milliseconds."""
+    calls: dict[int, float] = {}
+    round_trips: dict[int, float] = {}
+    with open(trace_path, "r", encoding="utf-8") as f:
+        for line in f:
+            span = json.loads(line)
+            if span["name"] == "tool.call":
+                calls[span["span_id"]] = span["duration_ms"]
+            elif span["name"] == "mcp.call_tool" and span["parent_id"] is not None:
+                round_trips[span["parent_id"]] = round_trips.get(span["parent_id"], 0.0) + span["duration_ms"]
+    return [duration - round_trips.get(span_id, 0.0) for span_id, duration in calls.items()]
+
+
+async def run_scenario(
+    scenario: dict[str, Any],
+    server_definitions: dict[str, Any],
+    fake_llm: FakeLLMServer,
+    corpus: str,
+    args: argparse.Namespace,
+    trace_memory: bool = False,
+) -> dict[str, Any]:
+    """Run every turn of a scenario once on fresh servers and return its metrics.
+
+    With trace_memory, only the peak Python heap is meaningful: tracemalloc slows
+    allocation-heavy code enough to distort the timings.
+    """
+    turns = _substitute(scenario["turns"], corpus)
+    fake_llm.load_script(
+        [turn["responses"] for turn in turns],
+        scenario.get("llm_latency_ms", args.llm_latency_ms),
+    )
+    trace_file = tempfile.NamedTemporaryFile(suffix=".jsonl", delete=False)
+    trace_file.close()
+    tracer.configure(trace_file.name)
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        result_cache = ToolResultCache()
+        servers = [
+            create_server(name, _server_config(server_definitions[name], args.launcher), result_cache=result_cache)
+            for name in scenario["servers"]
+        ]
+        llm_client = LLMClient("bench", fake_llm.base_url, model="fake")
+        session = ChatSession(servers, llm_client, stream=scenario.get("stream", False))
+        try:
+            started = time.perf_counter()
+            await session.initialize_servers()
+            startup_ms = (time.perf_counter() - started) * 1000
+            failed = [server.name for server in servers if server.session is None]
+            if failed:
+                raise RuntimeError(f"servers failed to start: {', '.join(failed)}")
+            history = ConversationHistory("You are a benchmark assistant.")
+            reports = []
+            turn_ms = []
+            # 流式模式会把文本增量打印到 stdout，基准测试中丢弃
+            with contextlib.redirect_stdout(io.StringIO()):
+                for turn in turns:
+                    _, report = await session.run_turn(history, turn["prompt"])
+                    turn_ms.append(report.elapsed * 1000)
+                    reports.append(report)
+        finally:
+            await session.cleanup_servers()
+            await llm_client.aclose()
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        tracer.close()
+    try:
+        overheads = _dispatch_overheads(trace_file.name)
+    finally:
+        os.unlink(trace_file.name)
+    return {
+        "startup_ms": startup_ms,
+        "turn_p50_ms": statistics.median(turn_ms),
+        "turn_max_ms": max(turn_ms),
+        "llm_ms": statistics.mean(report.llm_seconds * 1000 for report in reports),
+        "tool_ms": statistics.mean(report.tool_seconds * 1000 for report in reports),
+        "dispatch_overhead_ms": statistics.mean(overheads) if overheads else 0.0,
+        "tool_calls": len(overheads),
+        "peak_memory_kb": peak_memory / 1024 if trace_memory else None,
+        "prompt_tokens": sum(report.usage.prompt_tokens for report in reports),
+    }
+
+
+def _median_of_runs(runs: list[dict[str, Any]]) -> dict[str, Any]:
+    return {
+        key: round(statistics.median(run[key] for run in runs), 3)
+        for key in runs[0]
+        if runs[0][key] is not None
+    }
+
+
+def compare(results: dict[str, Any], baseline: dict[str, Any], tolerance: float) -> list[str]:
+    """List metrics that grew beyond the tolerance relative to the baseline."""
+    regressions = []
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if not base or "error" in metrics or "error" in base:
+            continue
+        for metric in METRICS:
+            if metric not in base:
+                continue
+            old, new = base[metric], metrics[metric]
+            if new <= old * (1 + tolerance):
+                continue
+            if metric.endswith("_ms") and new - old < _TIME_NOISE_MS:
+                continue
+            change = f"+{(new / old - 1) * 100:.0f}%" if old else "new"
+            regressions.append(f"{name}.{metric}: {old:.1f} -> {new:.1f} ({change})")
+    return regressions
+
+
+def format_table(results: dict[str, Any]) -> str:
+    columns = ["startup_ms", "turn_p50_ms", "turn_max_ms", "llm_ms", "tool_ms",
+               "dispatch_overhead_ms", "tool_calls", "peak_memory_kb", "prompt_tokens"]
+    headers = ["startup", "turn_p50", "turn_max", "llm", "tools", "dispatch", "calls", "peak_kb", "prompt_tok"]
+    lines = [f"{'scenario':<24}" + "".join(f"{header:>11}" for header in headers)]
+    for name, metrics in results.items():
+        if "error" in metrics:
+            lines.append(f"{name:<24} error: {metrics['error']}")
+            continue
+        lines.append(f"{name:<24}" + "".join(f"{metrics[column]:>11.1f}" for column in columns))
+    return "\n".join(lines)
+
+
+async def main(args: argparse.Namespace) -> int:
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(message)s")
+    with open(args.scenarios, "r", encoding="utf-8") as f:
+        suite = json.load(f)
+    scenarios = [s for s in suite["scenarios"] if not args.scenario or s["name"] in args.scenario]
+    corpus = generate_corpus(args.corpus_dir, files=args.corpus_files, lines_per_file=args.corpus_lines)
+    fake_llm = FakeLLMServer()
+    fake_llm.start()
+    results: dict[str, Any] = {}
+    try:
+        for scenario in scenarios:
+            runs = []
+            try:
+                for _ in range(args.repeat):
+                    runs.append(await run_scenario(scenario, suite["servers"], fake_llm, corpus, args))
+                # 内存单独跑一次，避免 tracemalloc 影响计时
+                memory_run = await run_scenario(
+                    scenario, suite["servers"], fake_llm, corpus, args, trace_memory=True
+                )
+            except Exception as e:
+                logging.error(f"Scenario {scenario['name']} failed: {e}")
+                results[scenario["name"]] = {"error": str(e)}
+                continue
+            results[scenario["name"]] = _median_of_runs(runs)
+            results[scenario["name"]]["peak_memory_kb"] = round(memory_run["peak_memory_kb"], 3)
+    finally:
+        fake_llm.stop()
+
+    print(format_table(results))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    exit_code = 0
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            print("\n".join(f"  {line}" for line in regressions))
+            exit_code = 1
+        else:
+            print("\nNo regressions against baseline.")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
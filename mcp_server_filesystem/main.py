@@ -1,3 +1,4 @@
+import argparse
 from mcp.server.fastmcp import FastMCP
 import os
 import logging
@@ -198,4 +199,16 @@ def get_file_info(path: str) -> str:
         return f"Error: {str(e)}"
 
 if __name__ == "__main__":
-    mcp.run() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="FileSystem MCP Server")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse"],
+        default="stdio",
+        help="stdio: run as a client's child process; sse: serve many clients over HTTP",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args()
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    mcp.run(transport=args.transport)
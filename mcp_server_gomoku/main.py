@@ -1,4 +1,5 @@
 
+import argparse
 from mcp.server.fastmcp import FastMCP
 from pydantic import BaseModel, Field
 import requests
@@ -41,4 +42,16 @@ def reset_game() -> dict:
     return {"status": response.status_code}
 
 if __name__ == "__main__":
-    mcp.run()
+    parser = argparse.ArgumentParser(description="Gomoku MCP Server")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse"],
+        default="stdio",
+        help="stdio: run as a client's child process; sse: serve many clients over HTTP",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8004)
+    args = parser.parse_args()
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    mcp.run(transport=args.transport)
@@ -1,6 +1,12 @@
-from mcp.server.fastmcp import FastMCP
-import psutil  # search_rg 中会用到
-from rg_search import RGSearchParams, build_rg_command, run_command
+import argparse
+import json
+import os
+from typing import Optional
+from mcp.server.fastmcp import Context, FastMCP
+from rg_search import RGSearchParams, SearchProgress, build_rg_command, execute_search, search_all_drives
+from spool import SpoolManager
+from path_index import PathIndexManager
+from result_cache import SearchResultCache
 import logging
 
 mcp = FastMCP(
@@ -8,8 +14,33 @@ mcp = FastMCP(
     description="MCP service for comprehensive file search based on ripgrep (rg.exe)."
 )
 
+# 超出 max_output_lines 的结果写入磁盘，供 search_rg_next 分页读取
+spools = SpoolManager()
+# --index-root 指定的目录建立文件名索引，files_only 搜索优先查询索引
+path_indexes = PathIndexManager()
+# 重复的搜索在文件未变化时直接返回上次的结果
+results = SearchResultCache()
+
+def create_progress(ctx: Context, params: RGSearchParams, first_hits: int) -> Optional[SearchProgress]:
+    """Progress reporter for a search, or None if the client did not ask for progress notifications."""
+    meta = ctx.request_context.meta
+    if meta is None or meta.progressToken is None:
+        return None
+
+    async def report(progress: float, message: str) -> None:
+        try:
+            await ctx.report_progress(progress, None, message)
+        except TypeError:
+            # mcp 1.10 之前的版本不支持 message
+            await ctx.report_progress(progress, None)
+
+    progress = SearchProgress(report, params, first_hits=max(first_hits, 0))
+    progress.start()
+    return progress
+
+
 @mcp.tool()
-def search_rg(params: dict, timeout: int = 30) -> str:
+async def search_rg(params: dict, ctx: Context, timeout: int = 30, progress_hits: int = 0) -> str:
     """
     使用 rg.exe 进行通用文本或文件名搜索的服务。
 
@@ -24,7 +55,7 @@ def search_rg(params: dict, timeout: int = 30) -> str:
        - 若要只匹配特定后缀（如 *.yaml），可结合 `glob` 参数
 
     [关键参数说明]
-    - `path`: 搜索起始路径（默认为当前目录）。若结果为空且为默认 "."，则自动遍历本地所有磁盘。
+    - `path`: 搜索起始路径（默认为当前目录）。若结果为空且为默认 "."，则自动并发搜索本地所有磁盘。
     - `query`: 待搜索的内容或文件名关键词（必填）
       - 在“内容搜索”模式下，支持正则表达式或固定字符串
       - 在“文件名搜索”模式下，当 `files_only=True`，则将 `query` 视为文件名的一部分（大小写敏感/不敏感依赖于 `case_sensitive` 与 `ignore_case` 设置）
@@ -36,19 +67,30 @@ def search_rg(params: dict, timeout: int = 30) -> str:
     - `hidden`: 是否包含隐藏文件
     - `max_filesize`: 跳过大于指定大小的文件（如 "50M"）
     - `threads`: 自定义搜索线程数
+    - `structured`: 内容搜索时返回解析后的紧凑结果（推荐）：首行为汇总（匹配行数、文件数、扫描的文件数与字节数、耗时），
+      其后按文件分组列出 `行号:列号: 行内容`，同一文件中重复的行只列一次并标注次数，上下文行以 `行号-` 标出且不计入行数上限；
+      `max_output_lines` 此时表示展示的不同匹配行数，超出部分只计数，未展示的文件附带命中数列在末尾
+
+    [顶层参数]（与 `params` 并列）
+    - `timeout`: 单次 ripgrep 调用的截止时间（秒，默认 30）
+    - `progress_hits`: 客户端请求了进度通知时，在通知中附带的前若干条命中（默认 0，只报告计数）。
+      搜索期间约每秒发送一次进度：已匹配的文件数、输出行数、已用时间，可据此尽早放弃不理想的查询；
+      客户端取消请求时，ripgrep 进程树会被立即结束
 
     [返回结果]
-    - 成功：返回匹配到的文本内容或文件列表（根据参数不同格式也不同）
+    - 成功：返回匹配到的文本内容或文件列表（根据参数不同格式也不同；`structured=True` 时为汇总后的结果）
     - 失败：以"Error:"开头的错误描述
-    - 超时：以"Error: Operation timed out..."返回
+    - 超时：已有结果作为第一页返回（附游标）；没有任何结果时以"Error: Operation timed out..."返回
+    - 结果超过 `max_output_lines` 行时只返回第一页，末尾附有游标，其余结果用 `search_rg_next` 分页读取（结构化模式不分页）
 
     [注意事项]
     1. 当 `files_only=True` 时，ripgrep 默认列出所有文件；因此代码里进行了特殊处理，使之仅显示文件名中包含 `query` 的项（若需更多复杂规则，请使用 `glob` 或自行实现逻辑）。
     2. 搜索内容时，ripgrep 可能被 `.gitignore` / `.ignore` 文件影响（可用 `no_ignore=True` 覆盖）。
     3. 搜索系统文件/隐藏文件时，可能需要管理员权限或者显式启用 `hidden=True`。
     4. 不支持统计空文件夹或列出目录，如需此功能应使用操作系统命令（如 `dir`、`find` 等）或文件系统 API。
-    5. 当 `path` 为 "." 且无结果时，工具会自动尝试搜索所有本地盘符，可能耗时较长。
-    6. 特殊字符（如反斜杠、正则符号）需要转义，示例：Windows 路径需写成 `"C:\\\\Users"`，正则里要写 `\\d` 代替 `\d`。
+    5. 服务器以 `--index-root` 为某目录建立了文件名索引时，该目录下的 `files_only` 搜索直接查询索引（毫秒级），返回的文件集合与 ripgrep 相同，但按路径排序（ripgrep 按遍历顺序输出，两者顺序不同）；索引未建好或过期时自动改用 ripgrep。
+    6. 当 `path` 为 "." 且无结果时，工具会并发搜索所有本地盘符（Linux/macOS 上为本地挂载点），所有盘共用一个 `timeout`，结果按盘分段并标注状态（超时的盘保留部分结果，无法访问的盘被跳过）；总行数达到 `max_output_lines` 后停止其余搜索。
+    7. 特殊字符（如反斜杠、正则符号）需要转义，示例：Windows 路径需写成 `"C:\\\\Users"`，正则里要写 `\\d` 代替 `\d`。
 
     [调用示例]
     1. 在日志文件中按正则搜索时间戳：
@@ -72,28 +114,31 @@ def search_rg(params: dict, timeout: int = 30) -> str:
         logging.getLogger("rg_search").info("Parsing input parameters...")
         # Validate and parse input parameters using RGSearchParams model
         rg_params = RGSearchParams(**params)
-        cmd = build_rg_command(rg_params)
-        logging.getLogger("rg_search").info("Starting search...")
-        output = run_command(cmd, timeout=timeout)
-
-        # 当输出为空且路径为默认 '.' 时，尝试对所有本地盘符搜索
-        if not output.strip() and (not rg_params.path or rg_params.path.strip() == "."):
-            logging.getLogger("rg_search").info("No result from initial search; searching all local drives...")
-            drives = [p.device for p in psutil.disk_partitions() if p.fstype and p.device[0].isalpha()]
-            if not drives:
-                logging.getLogger("rg_search").error("No local disks detected.")
-                return "No local disks detected."
-
-            results = []
-            for drive in drives:
-                if not drive.endswith("\\"):
-                    drive = drive + "\\"
-                logging.getLogger("rg_search").info(f"Searching drive {drive}...")
-                rg_params.path = drive
+        cache_key = results.make_key(rg_params)
+        cached = await results.get(cache_key)
+        if cached is not None:
+            logging.getLogger("rg_search").info("Returning cached result.")
+            return cached
+        progress = create_progress(ctx, rg_params, progress_hits)
+        try:
+            output = await path_indexes.search(rg_params, spools)
+            if output is None:
                 cmd = build_rg_command(rg_params)
-                drive_output = run_command(cmd, timeout=timeout)
-                results.append(f"Drive {drive}:\n{drive_output}")
-            output = "\n".join(results)
+                logging.getLogger("rg_search").info("Starting search...")
+                output = await execute_search(rg_params, cmd, timeout, spools=spools, progress=progress)
+
+            # 当输出为空且路径为默认 '.' 时，尝试对所有本地盘符搜索
+            if not output.strip() and (not rg_params.path or rg_params.path.strip() == "."):
+                logging.getLogger("rg_search").info("No result from initial search; searching all local drives...")
+                output = await search_all_drives(rg_params, timeout, progress)
+            else:
+                await results.store(cache_key, rg_params, output)
+            if progress is not None:
+                await progress.finish()
+        finally:
+            # 客户端取消请求时，任务在等待 ripgrep 处被取消，rg 进程树随即被结束
+            if progress is not None:
+                progress.stop()
 
         logging.getLogger("rg_search").info("Search complete.")
         return output
@@ -102,5 +147,85 @@ def search_rg(params: dict, timeout: int = 30) -> str:
         return f"Error: {str(ex)}"
 
 
+@mcp.tool()
+async def search_rg_next(cursor: str, max_lines: int = 1000, wait: float = 10) -> str:
+    """
+    读取 search_rg 结果的下一页。
+
+    当 search_rg 的输出超过 `max_output_lines` 时，ripgrep 不会被终止，其余结果在后台继续写入服务器本地的临时文件，
+    返回内容末尾会给出一个游标（cursor）。用该游标调用本工具即可继续读取，无需重新扫描目录。
+
+    [参数]
+    - `cursor`: 上一页末尾给出的游标
+    - `max_lines`: 本页最多返回的行数（默认 1000）
+    - `wait`: 搜索仍在进行且新结果不足一页时，最多等待的秒数（默认 10）
+
+    [返回结果]
+    - 本页的结果行，末尾注明行号范围，以及下一页的游标或 "end of results"
+    - 游标过期（默认 10 分钟未读取）或未知时返回以 "Error:" 开头的说明，此时需重新搜索
+    """
+    try:
+        return await spools.next_page(cursor, max_lines, wait)
+    except Exception as ex:
+        logging.getLogger("rg_search").error(f"Error reading next page: {str(ex)}")
+        return f"Error: {str(ex)}"
+
+
+@mcp.tool()
+def search_cache_stats() -> str:
+    """
+    返回 search_rg 结果缓存的统计信息（JSON）。
+
+    - `hits` / `misses` / `hit_rate`: 命中、未命中次数及命中率
+    - `stale`: 因文件变化或超过有效期而丢弃的条目数（同时计入未命中）
+    - `evictions`: 因超出容量而淘汰的条目数
+    - `entries` / `bytes` / `max_bytes`: 当前条目数、占用字节数和容量上限
+    - `ttl`: 条目的最长有效期（秒）
+    """
+    return json.dumps(results.stats(), indent=2)
+
+
 if __name__ == "__main__":
-    mcp.run()
+    parser = argparse.ArgumentParser(description="rg.exe File Search Service")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse"],
+        default="stdio",
+        help="stdio: run as a client's child process; sse: serve many clients over HTTP",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--spool-dir", default=spools.root, help="directory for paged search results")
+    parser.add_argument("--spool-ttl", type=float, default=spools.ttl, help="seconds an unread result cursor stays valid")
+    parser.add_argument(
+        "--spool-quota-mb", type=int, default=spools.quota_bytes // (1024 * 1024),
+        help="total disk space for paged search results",
+    )
+    parser.add_argument(
+        "--index-root", action="append", default=[],
+        help="keep a persistent filename index of this directory for files_only searches (repeatable)",
+    )
+    parser.add_argument(
+        "--index-dir", default=os.path.join(os.path.expanduser("~"), ".rg_search_index"),
+        help="directory for the filename index databases",
+    )
+    parser.add_argument(
+        "--index-refresh", type=float, default=30.0,
+        help="seconds between checks of indexed directories for changes",
+    )
+    parser.add_argument(
+        "--cache-mb", type=int, default=results.max_bytes // (1024 * 1024),
+        help="memory for cached search results (0 disables the cache)",
+    )
+    parser.add_argument("--cache-ttl", type=float, default=results.ttl, help="seconds a cached search result stays valid")
+    args = parser.parse_args()
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    spools.root = args.spool_dir
+    spools.ttl = args.spool_ttl
+    spools.quota_bytes = args.spool_quota_mb * 1024 * 1024
+    results.max_bytes = args.cache_mb * 1024 * 1024
+    results.ttl = args.cache_ttl
+    for root in args.index_root:
+        path_indexes.add_root(root, args.index_dir, args.index_refresh)
+    mcp.run(transport=args.transport)
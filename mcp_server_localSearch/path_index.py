@@ -0,0 +1,651 @@
+import asyncio
+import atexit
+import contextlib
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+from rg_search import RG_COMMAND, RGSearchParams
+from spool import SpoolManager
+
+logger = logging.getLogger("rg_search")
+
+# 索引结构变化时递增，旧索引会被重建
+_SCHEMA_VERSION = 2
+# 构建索引时每批写入的文件数
+_BATCH_SIZE = 10000
+# 一次 rg 调用传入的最多路径数
+_PATHS_PER_CALL = 200
+# 这些文件变化时 ripgrep 的过滤规则可能随之改变，需要完整重建
+_IGNORE_FILES = (".gitignore", ".ignore", ".rgignore")
+# rg --debug 对默认跳过的文件或目录（隐藏或被忽略）输出的日志
+_SKIP_PATTERN = re.compile(r" ignoring (.*?): Ignore\(")
+
+
+def glob_to_regex(pattern: str) -> str:
+    """Translate a ripgrep (gitignore style) glob into a regex: `*` and `?` stop at `/`, `**` crosses it."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == "*":
+            if pattern.startswith("**", i):
+                if pattern.startswith("**/", i):
+                    out.append("(?:.*/)?")
+                    i += 3
+                else:
+                    out.append(".*")
+                    i += 2
+                continue
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                negated = body[:1] in ("!", "^")
+                if negated:
+                    body = body[1:]
+                out.append("[" + ("^" if negated else "") + body.replace("\\", "\\\\") + "]")
+                i = end + 1
+                continue
+        elif c == "{":
+            end = pattern.find("}", i)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                alternatives = pattern[i + 1:end].split(",")
+                out.append("(?:" + "|".join(glob_to_regex(a) for a in alternatives) + ")")
+                i = end + 1
+                continue
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class GlobOverride:
+    """One `-g` / `--iglob` pattern; `!` negates, patterns without `/` match the file or directory name."""
+    def __init__(self, glob: str, case_insensitive: bool) -> None:
+        self.negated = glob.startswith("!")
+        pattern = glob[1:] if self.negated else glob
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        self.anchored = "/" in pattern
+        self.pattern = pattern.lstrip("/")
+        self.regex = re.compile(glob_to_regex(self.pattern), re.IGNORECASE if case_insensitive else 0)
+
+    def matches(self, path: str, name: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        return self.regex.fullmatch(path if self.anchored else name) is not None
+
+    def literals(self) -> List[str]:
+        """Plain runs of at least 3 characters in a name pattern, usable as a trigram prefilter."""
+        if self.negated or self.anchored:
+            return []
+        # 方括号、花括号和转义字符不是字面文本，作为分隔处理
+        runs = re.split(r"[*?]|\[.[^\]]*\]|\{[^}]*\}|\\.", self.pattern)
+        # trigram 索引按 SQLite 的规则忽略大小写，含有大小写之分的非 ASCII 字符时不用于预筛选
+        return [
+            run for run in runs
+            if len(run) >= 3 and not any(ord(ch) > 127 and ch.lower() != ch.upper() for ch in run)
+        ]
+
+
+class GlobMatcher:
+    """
+    ripgrep override semantics: the last matching glob wins, for directories too; entries no glob matches
+    follow the default filtering (hidden files and ignore rules), except that once any glob is positive,
+    files no glob matches are not listed.
+    """
+    def __init__(self, overrides: List[GlobOverride], prefix: str = "") -> None:
+        self.overrides = overrides
+        self.whitelist = any(not o.negated for o in overrides)
+        # 带 "/" 的 glob 与 ripgrep 输出的路径比较，即搜索路径（去掉开头的 "./"）加上相对路径
+        self.prefix = prefix
+        self._directories: dict = {}
+
+    def decide(self, path: str, name: str, is_dir: bool) -> Optional[bool]:
+        """True / False when a glob includes / excludes the entry, None when none matches."""
+        for override in reversed(self.overrides):
+            if override.matches(self.prefix + path, name, is_dir):
+                return not override.negated
+        return None
+
+    def _entered(self, directory: str, skipped: Set[str]) -> bool:
+        entered = self._directories.get(directory)
+        if entered is None:
+            parent, _, name = directory.rpartition("/")
+            if parent and not self._entered(parent, skipped):
+                entered = False
+            else:
+                decision = self.decide(directory, name, True)
+                entered = decision if decision is not None else directory not in skipped
+            self._directories[directory] = entered
+        return entered
+
+    def included(self, path: str, ignored: bool, skipped: Set[str]) -> bool:
+        """
+        Whether ripgrep lists a file. path is relative to the search path and `/`-separated; ignored tells
+        whether default filtering skips the file itself, skipped holds the directories it skips.
+        """
+        directory, _, name = path.rpartition("/")
+        if directory and not self._entered(directory, skipped):
+            return False
+        decision = self.decide(path, name, False)
+        if decision is not None:
+            return decision
+        return not self.whitelist and not ignored
+
+
+class PathIndex:
+    """
+    一个根目录下所有文件路径的持久化索引（SQLite，可用时附加 FTS5 trigram 索引加速文件名子串匹配）。
+
+    除了 `rg --files` 默认列出的文件，也收录隐藏和被忽略的文件，并记录每个文件和目录是否被默认规则跳过
+    （取自 `rg --debug` 的日志），因为 glob 匹配到的隐藏或被忽略的文件同样会被 ripgrep 列出。
+    后台线程定期检查已索引目录的修改时间，只重新列出发生变化的目录；.gitignore 等过滤规则文件变化时完整重建，
+    此外每隔 rebuild_interval 秒完整重建一次，补上增量更新发现不了的变化。
+    """
+    def __init__(
+        self,
+        root: str,
+        index_dir: str,
+        refresh_interval: float = 30.0,
+        rebuild_interval: float = 24 * 3600.0,
+    ) -> None:
+        self.root = os.path.abspath(root)
+        digest = hashlib.sha1(os.path.normcase(self.root).encode("utf-8")).hexdigest()[:16]
+        self.db_path = os.path.join(index_dir, f"{digest}.sqlite")
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        # 超过该时间未完成校验的索引视为过期，查询改用 ripgrep
+        self.max_staleness = 3 * refresh_interval
+        self.has_trigram = False
+        # 最近一次完成的构建或增量更新开始的时间，索引至少反映了该时刻的目录状态
+        self.verified_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._process: Optional[subprocess.Popen] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def usable(self) -> bool:
+        return self.verified_at is not None and time.time() - self.verified_at <= self.max_staleness
+
+    def start(self) -> None:
+        if self._thread is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name=f"path-index {self.root}", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        process = self._process
+        if process is not None and process.poll() is None:
+            process.kill()
+
+    def _connect(self) -> sqlite3.Connection:
+        # 事务由 _transaction 显式控制，使重建时删表和建表也在同一事务中
+        conn = sqlite3.connect(self.db_path, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @staticmethod
+    @contextlib.contextmanager
+    def _transaction(conn: sqlite3.Connection) -> Iterator[None]:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _run(self) -> None:
+        conn = self._connect()
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self._needs_build(conn) or not self._refresh(conn):
+                        self._build(conn)
+                except Exception as ex:
+                    if not self._stop.is_set():
+                        logger.error(f"Updating the path index of {self.root} failed: {ex}")
+                self._stop.wait(self.refresh_interval)
+        finally:
+            conn.close()
+
+    def _meta(self, conn: sqlite3.Connection) -> dict:
+        return dict(conn.execute("SELECT key, value FROM meta").fetchall())
+
+    def _needs_build(self, conn: sqlite3.Connection) -> bool:
+        try:
+            meta = self._meta(conn)
+        except sqlite3.DatabaseError:
+            return True
+        if meta.get("version") != str(_SCHEMA_VERSION) or meta.get("root") != self.root:
+            return True
+        self.has_trigram = meta.get("trigram") == "1"
+        return time.time() - float(meta.get("built_at", 0)) > self.rebuild_interval
+
+    def _ignore_state(self, conn: sqlite3.Connection) -> str:
+        """Fingerprint of the ignore files in the index (.gitignore, .ignore, .rgignore, .git/info/exclude)."""
+        digest = hashlib.sha1()
+        names = _IGNORE_FILES + ("exclude",)
+        placeholders = ", ".join("?" for _ in names)
+        rows = conn.execute(f"SELECT dir, name FROM files WHERE name IN ({placeholders}) ORDER BY dir, name", names)
+        for directory, name in rows:
+            if name == "exclude" and not directory.endswith(".git/info"):
+                continue
+            path = f"{directory}/{name}" if directory else name
+            try:
+                stat = os.stat(os.path.join(self.root, path))
+                digest.update(f"{path}\0{stat.st_mtime}\0{stat.st_size}\0".encode("utf-8"))
+            except OSError:
+                digest.update(f"{path}\0missing\0".encode("utf-8"))
+        return digest.hexdigest()
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        path = path.replace(os.sep, "/")
+        return path[2:] if path.startswith("./") else path
+
+    def _list(self, paths: List[str], max_depth: Optional[int] = None) -> Iterator[Tuple[str, bool]]:
+        """
+        (path, skipped) for the files under paths (relative to the root) that `rg --files` lists, with skipped
+        False, then for the hidden or ignored files and directories it skips, with skipped True.
+        """
+        cmd = [RG_COMMAND, "--files", "--debug", "--no-messages"]
+        if max_depth is not None:
+            cmd.extend(["--max-depth", str(max_depth)])
+        cmd.append("--")
+        cmd.extend(paths)
+        with tempfile.TemporaryFile() as log:
+            self._process = subprocess.Popen(
+                cmd, cwd=self.root, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=log
+            )
+            try:
+                for raw in self._process.stdout:
+                    if self._stop.is_set():
+                        raise RuntimeError("stopped")
+                    path = raw.decode("utf-8", errors="replace").rstrip("\r\n")
+                    if path:
+                        yield self._normalize(path), False
+            finally:
+                if self._process.poll() is None:
+                    self._process.kill()
+                self._process.wait()
+                self._process = None
+            log.seek(0)
+            for raw in log:
+                match = _SKIP_PATTERN.search(raw.decode("utf-8", errors="replace"))
+                if match:
+                    yield self._normalize(match.group(1)), True
+
+    @staticmethod
+    def _split(path: str) -> Tuple[str, str]:
+        directory, _, name = path.rpartition("/")
+        return directory, name
+
+    def _index_paths(
+        self, conn: sqlite3.Connection, paths: List[str], max_depth: Optional[int] = None
+    ) -> Tuple[Set[str], Set[str]]:
+        """
+        Add the files under paths to the index; returns the directories holding them and the directories
+        skipped by default. Without max_depth the skipped directories are listed too: given as explicit
+        paths, ripgrep reports what it would skip inside them.
+        """
+        directories, skipped_dirs = set(), set()
+        pending = list(paths)
+        batch = []
+        while pending:
+            chunk, pending = pending[:_PATHS_PER_CALL], pending[_PATHS_PER_CALL:]
+            for path, skipped in self._list(chunk, max_depth):
+                absolute = os.path.join(self.root, path)
+                if skipped:
+                    # ripgrep 不跟随符号链接，也不列出它们
+                    if os.path.islink(absolute):
+                        continue
+                    if os.path.isdir(absolute):
+                        skipped_dirs.add(path)
+                        if max_depth is None:
+                            pending.append(path)
+                        continue
+                directory, name = self._split(path)
+                directories.add(directory)
+                batch.append((directory, name, int(skipped)))
+                if len(batch) >= _BATCH_SIZE:
+                    conn.executemany("INSERT INTO files (dir, name, ignored) VALUES (?, ?, ?)", batch)
+                    batch = []
+        conn.executemany("INSERT INTO files (dir, name, ignored) VALUES (?, ?, ?)", batch)
+        return directories, skipped_dirs
+
+    def _create_tables(self, conn: sqlite3.Connection) -> None:
+        conn.execute("DROP TABLE IF EXISTS names")
+        conn.execute("DROP TABLE IF EXISTS files")
+        conn.execute("DROP TABLE IF EXISTS dirs")
+        conn.execute("DROP TABLE IF EXISTS meta")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(
+            "CREATE TABLE files (id INTEGER PRIMARY KEY, dir TEXT NOT NULL, name TEXT NOT NULL, ignored INTEGER NOT NULL)"
+        )
+        conn.execute("CREATE TABLE dirs (path TEXT PRIMARY KEY, mtime REAL NOT NULL, skipped INTEGER NOT NULL)")
+        try:
+            conn.execute(
+                "CREATE VIRTUAL TABLE names USING fts5(name, content='files', content_rowid='id', tokenize='trigram')"
+            )
+            self.has_trigram = True
+        except sqlite3.OperationalError:
+            # SQLite 早于 3.34 或未编译 FTS5：不做预筛选，直接扫描文件名
+            self.has_trigram = False
+
+    def _record_dirs(
+        self, conn: sqlite3.Connection, directories: Iterable[str], skipped_dirs: Set[str], started: float
+    ) -> None:
+        rows = []
+        for directory in directories:
+            try:
+                mtime = os.stat(os.path.join(self.root, directory)).st_mtime
+            except OSError:
+                continue
+            # 列出之后才修改的目录记为 -1，下次增量更新时重新列出
+            rows.append((directory, mtime if mtime < started else -1.0, int(directory in skipped_dirs)))
+        # 已有的目录只更新修改时间，是否被跳过由其父目录的列表决定，不在这里改变
+        conn.executemany(
+            "INSERT INTO dirs (path, mtime, skipped) VALUES (?, ?, ?) "
+            "ON CONFLICT (path) DO UPDATE SET mtime = excluded.mtime",
+            rows,
+        )
+
+    def _walk_dirs(self, paths: Iterable[str]) -> Set[str]:
+        """
+        All directories under paths (relative to the root), paths included. Empty directories hold no files
+        for ripgrep to list, but must be tracked so that files created in them later are picked up.
+        """
+        result = set()
+        pending = ["" if path == "." else path for path in paths]
+        while pending:
+            directory = pending.pop()
+            result.add(directory)
+            prefix = directory + "/" if directory else ""
+            try:
+                with os.scandir(os.path.join(self.root, directory)) as entries:
+                    # 与 ripgrep 一样不跟随符号链接
+                    pending.extend(prefix + entry.name for entry in entries if entry.is_dir(follow_symlinks=False))
+            except OSError:
+                continue
+        return result
+
+    @staticmethod
+    def _with_ancestors(directories: Iterable[str]) -> Set[str]:
+        result = {""}
+        for directory in directories:
+            while directory and directory not in result:
+                result.add(directory)
+                directory = directory.rpartition("/")[0]
+        return result
+
+    def _build(self, conn: sqlite3.Connection) -> None:
+        """Rebuild the whole index in one transaction; readers keep seeing the old one until it commits."""
+        started = time.time()
+        logger.info(f"Building the path index of {self.root}...")
+        with self._transaction(conn):
+            self._create_tables(conn)
+            directories, skipped_dirs = self._index_paths(conn, ["."])
+            conn.execute("CREATE INDEX files_dir ON files (dir)")
+            if self.has_trigram:
+                conn.execute("INSERT INTO names (names) VALUES ('rebuild')")
+                # 之后的增量更新通过触发器同步 trigram 索引
+                conn.execute(
+                    "CREATE TRIGGER files_ai AFTER INSERT ON files BEGIN "
+                    "INSERT INTO names (rowid, name) VALUES (new.id, new.name); END"
+                )
+                conn.execute(
+                    "CREATE TRIGGER files_ad AFTER DELETE ON files BEGIN "
+                    "INSERT INTO names (names, rowid, name) VALUES ('delete', old.id, old.name); END"
+                )
+            self._record_dirs(
+                conn, self._with_ancestors(directories | skipped_dirs | self._walk_dirs(["."])), skipped_dirs, started
+            )
+            conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                [
+                    ("version", str(_SCHEMA_VERSION)),
+                    ("root", self.root),
+                    ("built_at", str(started)),
+                    ("trigram", "1" if self.has_trigram else "0"),
+                    ("ignore_state", self._ignore_state(conn)),
+                ],
+            )
+            count = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        self.verified_at = started
+        logger.info(f"Path index of {self.root} built: {count} files in {time.time() - started:.1f}s")
+
+    def _refresh(self, conn: sqlite3.Connection) -> bool:
+        """
+        Re-list only the directories whose modification time changed since they were indexed.
+        Returns False when the ignore files changed, which needs a full rebuild.
+        """
+        started = time.time()
+        if self._ignore_state(conn) != self._meta(conn).get("ignore_state"):
+            return False
+        known = dict(conn.execute("SELECT path, mtime FROM dirs").fetchall())
+        changed, removed = [], []
+        for directory, mtime in known.items():
+            try:
+                current = os.stat(os.path.join(self.root, directory)).st_mtime
+            except FileNotFoundError:
+                removed.append(directory)
+                continue
+            except OSError:
+                continue
+            if current != mtime:
+                changed.append(directory)
+        if changed or removed:
+            with self._transaction(conn):
+                for directory in removed:
+                    self._delete_tree(conn, directory)
+                for directory in changed:
+                    if any(directory == r or directory.startswith(r + "/") for r in removed):
+                        continue
+                    self._relist(conn, directory, known, started)
+            logger.info(
+                f"Path index of {self.root} updated: {len(changed)} changed and "
+                f"{len(removed)} removed directories"
+            )
+            # 新增或删除了过滤规则文件
+            if self._ignore_state(conn) != self._meta(conn).get("ignore_state"):
+                return False
+        self.verified_at = started
+        return True
+
+    def _delete_tree(self, conn: sqlite3.Connection, directory: str) -> None:
+        if directory:
+            lower, upper = directory + "/", directory + "0"
+            conn.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (directory, lower, upper))
+            conn.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (directory, lower, upper))
+
+    def _relist(self, conn: sqlite3.Connection, directory: str, known: dict, started: float) -> None:
+        """Replace the files directly in a directory and index its new subdirectories."""
+        conn.execute("DELETE FROM files WHERE dir = ?", (directory,))
+        _, skipped_dirs = self._index_paths(conn, [directory or "."], max_depth=1)
+        prefix = directory + "/" if directory else ""
+        try:
+            with os.scandir(os.path.join(self.root, directory)) as entries:
+                subdirs = [prefix + entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except OSError:
+            subdirs = []
+        new_dirs = [sub for sub in subdirs if sub not in known]
+        directories, nested_skipped = self._index_paths(conn, new_dirs)
+        self._record_dirs(
+            conn,
+            [directory] + [d for d in self._with_ancestors(directories | self._walk_dirs(new_dirs)) if d not in known],
+            skipped_dirs | nested_skipped,
+            started,
+        )
+
+    def query(self, subpath: str, literals: List[str]) -> Tuple[List[Tuple[str, bool]], Set[str]]:
+        """
+        Files under subpath (relative to the root, `/`-separated) whose name may contain all literals, as
+        (path relative to subpath, skipped by default) pairs, and the directories below subpath skipped by default.
+        """
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            conn.execute("BEGIN")
+            skip = len(subpath) + 1 if subpath else 0
+            sql = "SELECT dir, name, ignored FROM files"
+            dirs_sql = "SELECT path FROM dirs WHERE skipped = 1"
+            conditions, args = [], []
+            if subpath:
+                conditions.append("(dir = ? OR (dir >= ? AND dir < ?))")
+                args.extend([subpath, subpath + "/", subpath + "0"])
+                dirs_sql += " AND path >= ? AND path < ?"
+            if literals and self.has_trigram:
+                # 每个字面子串作为一个短语，trigram 分词器按子串匹配
+                conditions.append("id IN (SELECT rowid FROM names WHERE names MATCH ?)")
+                args.append(" AND ".join('"' + literal.replace('"', '""') + '"' for literal in literals))
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            candidates = []
+            for directory, name, ignored in conn.execute(sql, args):
+                relative = directory[skip:]
+                candidates.append((f"{relative}/{name}" if relative else name, bool(ignored)))
+            skipped = {
+                path[skip:] for (path,) in conn.execute(dirs_sql, args[1:3] if subpath else [])
+            }
+        finally:
+            conn.close()
+        return candidates, skipped
+
+
+class PathIndexManager:
+    """Path indexes of the configured roots; answers files_only searches that fall inside one of them."""
+    def __init__(self) -> None:
+        self.indexes: List[PathIndex] = []
+
+    def add_root(
+        self, root: str, index_dir: str, refresh_interval: float = 30.0, rebuild_interval: float = 24 * 3600.0
+    ) -> None:
+        index = PathIndex(root, index_dir, refresh_interval, rebuild_interval)
+        self.indexes.append(index)
+        index.start()
+        atexit.register(index.stop)
+
+    def _find(self, path: str) -> Optional[Tuple[PathIndex, str]]:
+        target = os.path.normcase(os.path.abspath(path))
+        for index in self.indexes:
+            root = os.path.normcase(index.root)
+            if target == root:
+                return index, ""
+            if target.startswith(root.rstrip(os.sep) + os.sep):
+                return index, os.path.relpath(os.path.abspath(path), index.root).replace(os.sep, "/")
+        return None
+
+    @staticmethod
+    def _match_prefix(path: Optional[str]) -> Optional[str]:
+        """
+        Prefix ripgrep puts before a file's path relative to the search path when matching globs that
+        contain `/`: the search path relative to the current directory, or None if it lies outside of it.
+        """
+        if not path:
+            return ""
+        if os.path.isabs(path):
+            try:
+                relative = os.path.relpath(path, os.getcwd())
+            except ValueError:
+                # Windows 上不在同一盘符
+                return None
+            if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+                return None
+            path = relative
+        path = path.replace(os.sep, "/").rstrip("/")
+        while path.startswith("./"):
+            path = path[2:]
+        return "" if path in ("", ".") else path + "/"
+
+    async def search(self, params: RGSearchParams, spools: Optional[SpoolManager] = None) -> Optional[str]:
+        """
+        Answer a files_only search from the index, in the same format as ripgrep's paged output but sorted by path.
+
+        Returns None when no up-to-date index covers the search path, so the caller runs ripgrep instead.
+        """
+        if not self.indexes or not params.files_only:
+            return None
+        path = params.path or "."
+        found = self._find(path) if os.path.isdir(path) else None
+        if found is None:
+            return None
+        index, subpath = found
+        if not index.usable:
+            logger.info(f"Path index of {index.root} is not up to date, using ripgrep")
+            return None
+
+        # ripgrep 先加入 -g 的 glob，再加入 --iglob 的，因此忽略大小写时 query 排在 glob 之后
+        overrides = [GlobOverride(glob, case_insensitive=False) for glob in params.glob or []]
+        if params.query:
+            query = GlobOverride(params.query, case_insensitive=not params.case_sensitive)
+            overrides.insert(0 if params.case_sensitive else len(overrides), query)
+        match_prefix = self._match_prefix(params.path)
+        if match_prefix is None:
+            if any(o.anchored for o in overrides):
+                return None
+            match_prefix = ""
+        matcher = GlobMatcher(overrides, match_prefix)
+        positive = [o for o in overrides if not o.negated]
+        # 只有一个正向 glob 时，其中的字面子串可用于 trigram 预筛选（多个正向 glob 为“或”的关系）
+        literals = positive[0].literals() if len(positive) == 1 else []
+
+        # ripgrep 输出的路径以给定的搜索路径开头；未给出路径时为相对当前目录的路径
+        output_prefix = params.path.rstrip("/\\") + os.sep if params.path else ""
+
+        def collect() -> Tuple[List[str], int]:
+            candidates, skipped = index.query(subpath, literals)
+            lines = sorted(
+                output_prefix + relative.replace("/", os.sep) + "\n"
+                for relative, ignored in candidates
+                if matcher.included(relative, ignored, skipped)
+            )
+            return lines, len(candidates)
+
+        started = time.monotonic()
+        # 查询和逐个匹配在线程中进行，不阻塞事件循环
+        lines, candidate_count = await asyncio.to_thread(collect)
+        logger.info(
+            f"Path index answered in {(time.monotonic() - started) * 1000:.0f} ms: "
+            f"{len(lines)} of {candidate_count} candidates"
+        )
+
+        max_lines = params.max_output_lines or 1000
+        if len(lines) < max_lines:
+            return "".join(lines)
+        if len(lines) == max_lines:
+            return "".join(lines) + f"\n[Showing lines 1-{max_lines} (of {max_lines}); end of results]\n"
+        page = lines[:max_lines]
+        if spools is None:
+            return "".join(page) + "\n[Output truncated due to exceeding max_output_lines limit]\n"
+        # 其余结果写入已完成的结果文件，与 ripgrep 的分页输出一样用 search_rg_next 读取
+        spool = spools.create(first_line=max_lines + 1)
+        for line in lines[max_lines:]:
+            if not spool.write(line):
+                break
+        spool.finish("done" if spool.lines == len(lines) - max_lines else "full")
+        cursor = f"{spool.id}:0:0"
+        return "".join(page) + (
+            f'\n[Showing lines 1-{max_lines} (of {max_lines + spool.lines}). '
+            f'Call search_rg_next with cursor "{cursor}" for more]\n'
+        )
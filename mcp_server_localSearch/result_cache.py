@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from rg_search import RGSearchParams, build_rg_command
+
+logger = logging.getLogger("rg_search")
+
+# 带有这些标记的输出不完整（超时的部分结果、指向结果文件的游标），不缓存
+_INCOMPLETE_MARKERS = ("timed out after", "search_rg_next with cursor", "results may be incomplete")
+# 结构化输出中文件标题行的格式为 "路径 (N hits)"
+_PATH_SEPARATORS = (":", "-", " (")
+
+Fingerprint = List[Tuple[str, int, int]]
+
+
+class SearchResultCache:
+    """
+    LRU cache of search_rg outputs bounded by total size.
+
+    An entry is served only while its fingerprint still holds: the modification
+    times and sizes of the files in the result, plus the modification times of
+    the search root and of the directories holding those files. That catches
+    edited, deleted and added files next to the matches. A file edited in place
+    elsewhere in the tree can start matching without changing any of them, so
+    entries also expire after `ttl` seconds.
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 300.0) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.total_bytes = 0
+        # key -> (created_at, size, fingerprint, output)
+        self._entries: "OrderedDict[str, Tuple[float, int, Fingerprint, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # 因指纹变化或过期而丢弃的条目数（同时计入 misses）
+        self.stale = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(params: RGSearchParams) -> str:
+        """
+        Key on what determines the output: the ripgrep command (so parameters the search mode
+        ignores don't split the cache), the output options and the working directory.
+        """
+        normalized = {
+            "cmd": build_rg_command(params),
+            "structured": params.structured and not params.files_only,
+            "max_output_lines": params.max_output_lines or 1000,
+            "cwd": os.getcwd(),
+        }
+        return json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+
+    @staticmethod
+    def cacheable(output: str) -> bool:
+        return not output.startswith("Error:") and not any(marker in output for marker in _INCOMPLETE_MARKERS)
+
+    @staticmethod
+    def matched_files(params: RGSearchParams, output: str) -> Set[str]:
+        """Paths of the files that appear in a search_rg output."""
+        path = params.path
+        if path and os.path.isfile(path):
+            # 搜索单个文件时输出中不带文件名
+            return {path}
+        if params.json_output and not params.files_only:
+            files = set()
+            for line in output.splitlines():
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(message, dict) and message.get("type") == "begin":
+                    text = message.get("data", {}).get("path", {}).get("text")
+                    if text:
+                        files.add(text)
+            return files
+
+        # 输出行以搜索路径开头；文件名本身可能含有分隔符，依次尝试各个分隔位置，取第一个存在的文件
+        start = len(path.rstrip("/\\")) + 1 if path else 1
+        files: Set[str] = set()
+        current: Optional[str] = None
+        for line in output.splitlines():
+            # 结构化输出的匹配记录行以空格缩进，方括号行为说明
+            if not line or line[0].isspace() or line.startswith("[") or line == "--":
+                continue
+            if current is not None and line.startswith(current):
+                rest = line[len(current):]
+                if not rest or rest.startswith(_PATH_SEPARATORS):
+                    continue
+            positions = sorted(
+                {i for sep in _PATH_SEPARATORS for i in _find_all(line, sep, start)} | {len(line)}
+            )
+            for position in positions:
+                if os.path.isfile(line[:position]):
+                    current = line[:position]
+                    files.add(current)
+                    break
+        return files
+
+    @staticmethod
+    def fingerprint(params: RGSearchParams, files: Set[str]) -> Fingerprint:
+        paths = set(files)
+        root = params.path or "."
+        paths.add(root)
+        for file in files:
+            # 匹配文件所在的目录直到搜索根目录：其中新增、删除或重命名文件都会改变修改时间
+            directory = os.path.dirname(file)
+            while directory and directory not in paths and len(directory) > len(root.rstrip("/\\")):
+                paths.add(directory)
+                directory = os.path.dirname(directory)
+        result = []
+        for path in sorted(paths):
+            try:
+                stat = os.stat(path)
+                result.append((path, stat.st_mtime_ns, stat.st_size if os.path.isfile(path) else 0))
+            except OSError:
+                result.append((path, -1, -1))
+        return result
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        created_at, _, fingerprint, output = entry
+        # 在线程中检查文件状态，慢速磁盘不会阻塞事件循环
+        if time.monotonic() - created_at > self.ttl or await asyncio.to_thread(self._changed, fingerprint):
+            if self._entries.get(key) is entry:
+                self._remove(key)
+            logger.info("Cached result is out of date, searching again")
+            self.stale += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return output
+
+    @staticmethod
+    def _changed(fingerprint: Fingerprint) -> bool:
+        for path, mtime, size in fingerprint:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                if mtime != -1:
+                    return True
+                continue
+            if stat.st_mtime_ns != mtime or (size and stat.st_size != size):
+                return True
+        return False
+
+    async def store(self, key: str, params: RGSearchParams, output: str) -> None:
+        """Cache a complete output together with the fingerprint of the files it lists."""
+        if self.max_bytes <= 0 or not self.cacheable(output):
+            return
+
+        def build() -> Fingerprint:
+            return self.fingerprint(params, self.matched_files(params, output))
+
+        self.put(key, output, await asyncio.to_thread(build))
+
+    def put(self, key: str, output: str, fingerprint: Fingerprint) -> None:
+        size = len(output.encode("utf-8")) + sum(len(path) + 16 for path, _, _ in fingerprint)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic(), size, fingerprint, output)
+        self.total_bytes += size
+        while self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, size, _, _ = self._entries.pop(key)
+        self.total_bytes -= size
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
+
+
+def _find_all(text: str, sub: str, start: int) -> List[int]:
+    positions = []
+    index = text.find(sub, start)
+    while index != -1:
+        positions.append(index)
+        index = text.find(sub, index + 1)
+    return positions
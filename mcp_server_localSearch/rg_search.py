@@ -1,8 +1,14 @@
+import asyncio
+import base64
+import json
+import os
 import subprocess
+import threading
 import psutil  # 用于获取本地磁盘和管理子进程
 import logging
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from spool import ResultSpool, SpoolManager
+from typing import Awaitable, Callable, Optional, List
 import sys
 import re
 import time
@@ -42,6 +48,11 @@ class RGSearchParams(BaseModel):
     max_columns: Optional[int] = Field(None, description="Limit the maximum number of characters per line")
     threads: Optional[int] = Field(None, description="Number of threads to use")
     files_only: bool = Field(False, description="Only search for filenames (do not search file contents)")
+    structured: bool = Field(
+        False,
+        description="Return compact parsed results (per-file hit counts, deduplicated lines, summary header) "
+                    "instead of raw ripgrep output; ignored when files_only is set",
+    )
 
     # 新增：限制最大返回的行数，防止输出过多
     max_output_lines: Optional[int] = Field(
@@ -54,7 +65,7 @@ def build_rg_command(params: RGSearchParams) -> List[str]:
     """
     Build the command line argument list for calling rg.exe based on the parameters.
     """
-    cmd = ["rg.exe"]
+    cmd = [RG_COMMAND]
 
     if params.files_only:
         cmd.append("--files")
@@ -86,7 +97,7 @@ def build_rg_command(params: RGSearchParams) -> List[str]:
             cmd.append("--follow")
         if params.only_matching:
             cmd.append("--only-matching")
-        if params.json_output:
+        if params.json_output or params.structured:
             cmd.append("--json")
         if params.stats:
             cmd.append("--stats")
@@ -119,7 +130,319 @@ def build_rg_command(params: RGSearchParams) -> List[str]:
     return cmd
 
 
-def run_command(cmd: List[str], timeout: int, max_output_lines: int = 1000) -> str:
+# ripgrep 可执行文件
+RG_COMMAND = "rg.exe"
+# 遍历所有磁盘时，根目录需在该时间（秒）内可列出，否则视为无响应的网络盘或挂载点而跳过
+_PROBE_TIMEOUT = 2.0
+# 遍历所有磁盘时跳过的网络文件系统类型
+_REMOTE_FSTYPES = {"nfs", "nfs4", "cifs", "smbfs", "smb3", "sshfs", "fuse.sshfs", "9p", "afs"}
+# 结构化模式：单条记录的最大字符数；展示上限之外继续计数的倍数；末尾列出的未展示文件数；
+# 一行中逐个列出位置的最大匹配数
+_MAX_RECORD_CHARS = 300
+_COUNT_LIMIT_FACTOR = 10
+_MAX_HIDDEN_FILES = 20
+_MAX_LISTED_SPANS = 4
+# 单行输出的上限（字节），超长的行（如压缩过的文件）被跳过，避免撑爆读缓冲
+_MAX_LINE_BYTES = 1024 * 1024
+
+
+def clean_error_message(err: str) -> str:
+    """Remove debug info and normalize error messages"""
+    # 移除代码文件引用（如 rg_search.py:104）
+    err = re.sub(r'\w+\.py:\d+:\s*', '', err)
+    # 合并重复错误
+    errors = list(set(err.splitlines()))
+    return '\n'.join(e for e in errors if e.strip())
+
+
+def kill_process_tree(pid: int):
+    """Terminate a process and all its children"""
+    try:
+        parent = psutil.Process(pid)
+        children = parent.children(recursive=True)
+        for child in children:
+            try:
+                child.kill()
+            except psutil.NoSuchProcess:
+                pass
+        parent.kill()
+    except psutil.NoSuchProcess:
+        pass
+    except Exception as ex:
+        logger.error(f"Process termination failed: {str(ex)}")
+
+
+def log_stderr(stderr_data: str) -> None:
+    """Log ripgrep's stderr, summarizing the common not-found / permission errors."""
+    stderr_data = clean_error_message(stderr_data)
+
+    # 处理和过滤常见的 os error
+    if "os error 2" in stderr_data.lower():
+        logger.warning("Some file or path not found (os error 2)")
+    if "os error 5" in stderr_data.lower():
+        logger.warning("Permission denied for some locations (os error 5)")
+
+    # 过滤已处理的错误类型
+    filtered_errors = [
+        line for line in stderr_data.split('\n')
+        if line.strip() and
+        not any(err in line.lower() for err in ["os error 2", "os error 5"])
+    ]
+    if filtered_errors:
+        logger.warning(f"Command warnings: {' | '.join(filtered_errors)}")
+
+
+class SearchProgress:
+    """
+    Running counts of a search (files with matches, output lines, elapsed time), reported
+    through `report(progress, message)` every `interval` seconds while they change.
+
+    With first_hits > 0 the first hits are added to the message as soon as they arrive.
+    For raw output the files are counted from the path before the first ":" of each line,
+    so names containing ":" or context lines can make the count approximate.
+    """
+    def __init__(
+        self,
+        report: Callable[[float, str], Awaitable[None]],
+        params: RGSearchParams,
+        first_hits: int = 0,
+        interval: float = 1.0,
+    ) -> None:
+        self.report = report
+        self.json_mode = (params.json_output or params.structured) and not params.files_only
+        self.files_only = params.files_only
+        # 搜索单个文件时输出中不带文件名
+        self.single_file = bool(params.path) and os.path.isfile(params.path)
+        self.first_hits = first_hits
+        self.interval = interval
+        self.started = time.monotonic()
+        self.files = 0
+        self.lines = 0
+        self.hits: List[str] = []
+        self._last_file: Optional[str] = None
+        self._reported = (0, 0, 0)
+        self._updated = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def feed(self, line: str) -> None:
+        """Count one output line of ripgrep."""
+        if self.json_mode:
+            # rg --json 的每个匹配文件以 begin 事件开始，每个匹配行是一条 match 事件
+            if line.startswith('{"type":"begin"'):
+                self.files += 1
+            elif line.startswith('{"type":"match"'):
+                self.lines += 1
+                if len(self.hits) < self.first_hits:
+                    data = json.loads(line).get("data", {})
+                    path = _json_text(data.get("path"))
+                    text = _json_text(data.get("lines")).rstrip("\r\n")
+                    self._add_hit(f"{path}:{data.get('line_number')}:{text}")
+            return
+        self.lines += 1
+        if self.files_only:
+            self.files += 1
+        elif self.single_file:
+            self.files = 1
+        else:
+            # 跳过 Windows 盘符中的冒号
+            start = 2 if len(line) > 2 and line[1] == ":" and line[2] in "\\/" else 0
+            end = line.find(":", start)
+            if end > 0 and line[:end] != self._last_file:
+                self._last_file = line[:end]
+                self.files += 1
+        if len(self.hits) < self.first_hits:
+            self._add_hit(line.rstrip("\r\n"))
+
+    def _add_hit(self, text: str) -> None:
+        if len(text) > _MAX_RECORD_CHARS:
+            text = text[:_MAX_RECORD_CHARS] + "..."
+        self.hits.append(text)
+        self._updated.set()
+
+    def message(self) -> str:
+        text = f"{self.files} files with matches, {self.lines} lines, {time.monotonic() - self.started:.1f}s"
+        if self.hits:
+            text += "\nFirst hits:\n" + "\n".join(self.hits)
+        return text
+
+    async def _send(self) -> None:
+        self._reported = (self.files, self.lines, len(self.hits))
+        try:
+            await self.report(self.lines, self.message())
+        except Exception as ex:
+            # 通知发送失败（如客户端已断开）不影响搜索本身
+            logger.warning(f"Failed to report search progress: {ex}")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_report = loop.time() + self.interval
+        while True:
+            try:
+                await asyncio.wait_for(self._updated.wait(), max(next_report - loop.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+            self._updated.clear()
+            if len(self.hits) > self._reported[2] or (
+                loop.time() >= next_report and (self.files, self.lines) != self._reported[:2]
+            ):
+                await self._send()
+            if loop.time() >= next_report:
+                next_report = loop.time() + self.interval
+            # 连续到达的命中合并到同一条通知中
+            await asyncio.sleep(0.1)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def finish(self) -> None:
+        """Stop the periodic reports and send the final counts, unless they were just sent."""
+        self.stop()
+        if (self.files, self.lines, len(self.hits)) != self._reported:
+            await self._send()
+
+
+class LineBudget:
+    """
+    Result lines shared by concurrent searches. Each search counts its lines as they
+    arrive (match events for JSON output); once `max_lines` are in, `exhausted` is set
+    and every search using the budget stops, keeping what it has found.
+    """
+    def __init__(self, max_lines: int, json_mode: bool = False) -> None:
+        self.max_lines = max_lines
+        self.json_mode = json_mode
+        self.lines = 0
+        self.exhausted = asyncio.Event()
+
+    def feed(self, line: str) -> None:
+        if self.json_mode and not line.startswith('{"type":"match"'):
+            return
+        self.lines += 1
+        if self.lines >= self.max_lines:
+            self.exhausted.set()
+
+
+async def stream_command(
+    cmd: List[str],
+    timeout: float,
+    on_line: Callable[[str], bool],
+    progress: Optional[SearchProgress] = None,
+    budget: Optional[LineBudget] = None,
+) -> str:
+    """
+    Run the command and pass each decoded stdout line to `on_line` as it arrives
+    (and to `progress`, which counts it for progress notifications, and to `budget`,
+    shared with concurrent searches: the command stops once it is exhausted).
+
+    stdout and stderr are drained concurrently, so a full stderr pipe cannot
+    stall ripgrep, and `timeout` is a hard wall-clock deadline even while
+    ripgrep produces no output. The process tree is killed on timeout, when
+    `on_line` returns False, and on cancellation.
+
+    Returns:
+        str: "done" when the process finished, "stopped" when `on_line` asked
+        to stop, "timeout" when the deadline passed
+
+    Raises:
+        FileNotFoundError: the executable was not found
+    """
+    logger.info(f"Executing: {subprocess.list2cmdline(cmd)}")
+
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        limit=_MAX_LINE_BYTES,
+    )
+
+    status = "done"
+    skipped_long_lines = 0
+
+    async def read_stdout() -> None:
+        nonlocal status, skipped_long_lines
+        skipping = False
+        while True:
+            try:
+                line = await process.stdout.readuntil(b"\n")
+            except asyncio.IncompleteReadError as ex:
+                # stdout 读完；最后一行可能没有换行符
+                line = ex.partial
+                if not line or skipping:
+                    break
+            except asyncio.LimitOverrunError as ex:
+                # 单行超过 _MAX_LINE_BYTES：丢弃缓冲中换行符之前的部分（ex.consumed 不含换行符），
+                # 下一次读到的内容直到换行符为止都属于这一行，也一并丢弃
+                await process.stdout.readexactly(ex.consumed)
+                if not skipping:
+                    skipped_long_lines += 1
+                skipping = True
+                continue
+            if skipping:
+                skipping = False
+                continue
+            text = line.decode("utf-8", errors="replace")
+            if progress is not None:
+                progress.feed(text)
+            if budget is not None:
+                budget.feed(text)
+            if not on_line(text) or (budget is not None and budget.exhausted.is_set()):
+                status = "stopped"
+                break
+        if status == "done":
+            await process.wait()
+
+    # stderr 与 stdout 同时读取，避免 stderr 管道写满后 rg 阻塞
+    stderr_task = asyncio.create_task(process.stderr.read())
+    reader = asyncio.create_task(read_stdout())
+    # 共享的行数预算用尽时（并发的其他搜索已凑够结果），即使本搜索没有新的输出也立即停止
+    stopper = asyncio.create_task(budget.exhausted.wait()) if budget is not None else None
+    try:
+        done, _ = await asyncio.wait(
+            {reader, stopper} if stopper is not None else {reader},
+            timeout=timeout,
+            return_when=asyncio.FIRST_COMPLETED,
+        )
+        if reader in done:
+            reader.result()
+        elif done:
+            status = "stopped"
+        else:
+            logger.error(f"Command timed out after {timeout} seconds")
+            status = "timeout"
+    finally:
+        for task in (reader, stopper):
+            if task is not None and not task.done():
+                task.cancel()
+        # 超时、提前停止或被取消时进程仍在运行，连同子进程一起结束
+        if process.returncode is None:
+            kill_process_tree(process.pid)
+        try:
+            stderr_data = await asyncio.wait_for(stderr_task, 5)
+            await asyncio.wait_for(process.wait(), 5)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            stderr_task.cancel()
+            stderr_data = b""
+        log_stderr(stderr_data.decode("utf-8", errors="replace"))
+
+    if skipped_long_lines:
+        logger.warning(f"Skipped {skipped_long_lines} output lines longer than {_MAX_LINE_BYTES} bytes")
+    return status
+
+
+async def run_command(
+    cmd: List[str],
+    timeout: float,
+    max_output_lines: int = 1000,
+    keep_partial: bool = False,
+    progress: Optional[SearchProgress] = None,
+    budget: Optional[LineBudget] = None,
+) -> str:
     """
     Execute the given command and return its output.
     If output exceeds `max_output_lines`, it will be truncated.
@@ -129,109 +452,473 @@ def run_command(cmd: List[str], timeout: int, max_output_lines: int = 1000) -> s
         cmd: Command to execute as list of arguments
         timeout: Maximum execution time in seconds
         max_output_lines: Max lines to return from the search output
+        keep_partial: On timeout, return the lines read so far instead of an error
+        progress: Counts the output for progress notifications
+        budget: Line budget shared with concurrent searches; stops the command once exhausted
 
     Returns:
         str: Command output or error message
     """
-    def clean_error_message(err: str) -> str:
-        """Remove debug info and normalize error messages"""
-        # 移除代码文件引用（如 rg_search.py:104）
-        err = re.sub(r'\w+\.py:\d+:\s*', '', err)
-        # 合并重复错误
-        errors = list(set(err.splitlines()))
-        return '\n'.join(e for e in errors if e.strip())
-
-    def kill_process_tree(pid: int):
-        """Terminate a process and all its children"""
-        try:
-            parent = psutil.Process(pid)
-            children = parent.children(recursive=True)
-            for child in children:
-                try:
-                    child.kill()
-                except psutil.NoSuchProcess:
-                    pass
-            parent.kill()
-        except psutil.NoSuchProcess:
-            pass
-        except Exception as ex:
-            logger.error(f"Process termination failed: {str(ex)}")
+    collected_lines = []
 
-    logger.info(f"Executing: {subprocess.list2cmdline(cmd)}")
+    def collect(line: str) -> bool:
+        collected_lines.append(line)
+        # 超过最大行数，截断输出
+        return len(collected_lines) < max_output_lines
 
     try:
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            encoding="utf-8",
-            errors="replace",
-            shell=False
-        )
+        status = await stream_command(cmd, timeout, collect, progress, budget)
+    except FileNotFoundError:
+        logger.error("ripgrep (rg.exe) not found")
+        return "Error: ripgrep executable not found in PATH"
+    except Exception as ex:
+        logger.error(f"Unexpected error: {str(ex)}")
+        return f"Error: {str(ex)}"
 
-        # 手动按行读取 stdout
-        collected_lines = []
-        truncated = False
+    if status == "timeout" and (not keep_partial or not collected_lines):
+        return f"Error: Operation timed out after {timeout} seconds"
 
-        start_time = time.time()
-        while True:
-            # 超时检查
-            if time.time() - start_time > timeout:
-                logger.error(f"Command timed out after {timeout} seconds")
-                kill_process_tree(process.pid)
-                return f"Error: Operation timed out after {timeout} seconds"
-
-            line = process.stdout.readline()
-            if not line:
-                # 说明 stdout 读完
-                break
-            collected_lines.append(line)
-            if len(collected_lines) >= max_output_lines:
-                # 超过最大行数，截断输出
-                kill_process_tree(process.pid)
-                truncated = True
-                break
+    # 如果发生截断，则在输出末尾附加提醒
+    output_text = "".join(collected_lines)
+    if status == "stopped":
+        output_text += "\n[Output truncated due to exceeding max_output_lines limit]\n"
+    elif status == "timeout":
+        output_text += f"\n[Search timed out after {timeout:.0f} seconds; results are partial]\n"
+
+    return output_text
 
-        # 此时子进程要么自然结束，要么已被 kill；可以安全读取剩下的 stderr
-        stderr_data = process.stderr.read()
-        stderr_data = clean_error_message(stderr_data)
 
-        # 处理和过滤常见的 os error
-        if "os error 2" in stderr_data.lower():
-            logger.warning("Some file or path not found (os error 2)")
-        if "os error 5" in stderr_data.lower():
-            logger.warning("Permission denied for some locations (os error 5)")
+def _json_text(value: Optional[dict]) -> str:
+    """Text of an rg --json "text"/"bytes" object (bytes are base64 for non-UTF-8 data)."""
+    if not value:
+        return ""
+    if "text" in value:
+        return value["text"]
+    return base64.b64decode(value.get("bytes", "")).decode("utf-8", errors="replace")
 
-        # 过滤已处理的错误类型
-        filtered_errors = [
-            line for line in stderr_data.split('\n')
-            if line.strip() and
-            not any(err in line.lower() for err in ["os error 2", "os error 5"])
-        ]
-        if filtered_errors:
-            logger.warning(f"Command warnings: {' | '.join(filtered_errors)}")
 
-        # 如果发生截断，则在输出末尾附加提醒
-        output_text = "".join(collected_lines)
-        if truncated:
-            output_text += "\n[Output truncated due to exceeding max_output_lines limit]\n"
+def _format_size(size: float) -> str:
+    for unit in ["B", "KB", "MB", "GB"]:
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
 
-        return output_text
 
+class RGJsonAggregator:
+    """
+    将 `rg --json` 事件流逐行解析为紧凑的匹配记录：按文件汇总命中数，
+    同一文件中重复出现的相同行只保留一条并计数，最后附上扫描统计。
+    """
+    def __init__(self, max_matches: int = 1000) -> None:
+        self.max_matches = max_matches
+        # 展示的记录数达到上限后继续计数，直到总匹配行数达到 count_limit 再停止 rg
+        self.count_limit = max_matches * _COUNT_LIMIT_FACTOR
+        # 文件路径 -> {"hits": 命中行数, "records": 展示的记录, "seen": 行文本 -> 记录}
+        self.files: dict = {}
+        self.matched_lines = 0
+        self.shown = 0
+        self.summary: Optional[dict] = None
+        self.started = time.monotonic()
+
+    def feed(self, line: str) -> bool:
+        """Consume one JSON event; returns False once enough matches have been counted."""
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return True
+        kind = event.get("type")
+        data = event.get("data") or {}
+        if kind == "match":
+            self._add_match(data)
+        elif kind == "context":
+            self._add_context(data)
+        elif kind == "summary":
+            self.summary = data
+        return self.matched_lines < self.count_limit
+
+    def _file(self, data: dict) -> dict:
+        path = _json_text(data.get("path"))
+        if path not in self.files:
+            self.files[path] = {"hits": 0, "records": [], "seen": {}}
+        return self.files[path]
+
+    @staticmethod
+    def _line_text(data: dict) -> str:
+        text = _json_text(data.get("lines")).rstrip("\r\n")
+        if len(text) > _MAX_RECORD_CHARS:
+            text = text[:_MAX_RECORD_CHARS] + "..."
+        return text
+
+    def _add_match(self, data: dict) -> None:
+        entry = self._file(data)
+        entry["hits"] += 1
+        self.matched_lines += 1
+        text = self._line_text(data)
+        record = entry["seen"].get(text.strip())
+        if record is not None:
+            record["count"] += 1
+            return
+        if self.shown >= self.max_matches:
+            return
+        submatches = data.get("submatches") or []
+        record = {
+            "line": data.get("line_number"),
+            "column": submatches[0]["start"] + 1 if submatches else None,
+            "spans": [(m["start"], m["end"]) for m in submatches] if len(submatches) > 1 else None,
+            "text": text,
+            "count": 1,
+        }
+        entry["records"].append(record)
+        entry["seen"][text.strip()] = record
+        self.shown += 1
+
+    def _add_context(self, data: dict) -> None:
+        # 达到展示上限后不再保留上下文行；上下文行不计入匹配数
+        if self.shown >= self.max_matches:
+            return
+        self._file(data)["records"].append(
+            {"line": data.get("line_number"), "context": True, "text": self._line_text(data)}
+        )
+
+    def render(self, status: str = "done", timeout: Optional[float] = None) -> str:
+        """Summary header followed by the matches grouped per file."""
+        header = f"[{self.matched_lines} matching lines in {len(self.files)} files"
+        if self.summary:
+            stats = self.summary.get("stats") or {}
+            elapsed = (self.summary.get("elapsed_total") or {}).get("human", "")
+            header += (
+                f"; searched {stats.get('searches', 0)} files, "
+                f"{_format_size(stats.get('bytes_searched', 0))} in {elapsed}"
+            )
+        else:
+            header += f"; {time.monotonic() - self.started:.3f}s"
+        lines = [header + "]"]
+        if status == "stopped":
+            lines.append(f"[Stopped after {self.matched_lines} matching lines; counts are lower bounds]")
+        elif status == "timeout":
+            lines.append(f"[Search timed out after {timeout:.0f} seconds; results are partial]")
+        if self.shown >= self.max_matches:
+            lines.append(f"[Showing the first {self.max_matches} distinct lines]")
+
+        hidden = []
+        for path, entry in self.files.items():
+            if not any(not record.get("context") for record in entry["records"]):
+                hidden.append(f"{path} ({entry['hits']})")
+                continue
+            lines.append(f"{path} ({entry['hits']} {'hit' if entry['hits'] == 1 else 'hits'})")
+            for record in entry["records"]:
+                if record.get("context"):
+                    lines.append(f"  {record['line']}- {record['text']}")
+                    continue
+                location = f"{record['line']}:{record['column']}" if record["column"] else f"{record['line']}"
+                text = f"  {location}: {record['text']}"
+                spans = record["spans"]
+                if spans and len(spans) > _MAX_LISTED_SPANS:
+                    text += f"  {{{len(spans)} matches}}"
+                elif spans:
+                    text += "  {" + ", ".join(f"{start}-{end}" for start, end in spans) + "}"
+                if record["count"] > 1:
+                    text += f"  (x{record['count']})"
+                lines.append(text)
+        if hidden:
+            shown_hidden = ", ".join(hidden[:_MAX_HIDDEN_FILES])
+            more = f" and {len(hidden) - _MAX_HIDDEN_FILES} more" if len(hidden) > _MAX_HIDDEN_FILES else ""
+            lines.append(f"[{len(hidden)} more files with matches: {shown_hidden}{more}]")
+        return "\n".join(lines) + "\n"
+
+
+async def run_structured(
+    cmd: List[str],
+    timeout: float,
+    max_matches: int = 1000,
+    progress: Optional[SearchProgress] = None,
+    budget: Optional[LineBudget] = None,
+) -> str:
+    """Run an `rg --json` command and return its aggregated, compact rendering."""
+    aggregator = RGJsonAggregator(max_matches)
+    try:
+        status = await stream_command(cmd, timeout, aggregator.feed, progress, budget)
     except FileNotFoundError:
         logger.error("ripgrep (rg.exe) not found")
         return "Error: ripgrep executable not found in PATH"
     except Exception as ex:
         logger.error(f"Unexpected error: {str(ex)}")
         return f"Error: {str(ex)}"
+    if status == "timeout" and not aggregator.matched_lines:
+        return f"Error: Operation timed out after {timeout} seconds"
+    if not aggregator.matched_lines:
+        # 与原始模式一致：没有结果时返回空字符串，以便触发遍历所有磁盘
+        return ""
+    return aggregator.render(status, timeout)
+
+
+async def run_paged(
+    cmd: List[str],
+    timeout: float,
+    page_lines: int,
+    spools: SpoolManager,
+    progress: Optional[SearchProgress] = None,
+) -> str:
+    """
+    Return the first `page_lines` lines of output; the rest keeps streaming into
+    an on-disk spool that search_rg_next reads page by page.
+
+    If the first page is not full after `timeout` seconds, the lines found so far
+    are returned and the search goes on in the background as well, for at most
+    `spools.search_timeout` seconds in total.
+    """
+    page = []
+    spool: Optional[ResultSpool] = None
+    page_ready = asyncio.Event()
+    more_ready = asyncio.Event()
+
+    def on_line(line: str) -> bool:
+        nonlocal spool
+        if spool is not None:
+            more_ready.set()
+            return spool.write(line)
+        page.append(line)
+        if len(page) >= page_lines:
+            spool = spools.create(first_line=len(page) + 1)
+            page_ready.set()
+        return True
+
+    async def wait_for(event: asyncio.Event, deadline: float) -> None:
+        waiter = asyncio.create_task(event.wait())
+        try:
+            await asyncio.wait(
+                {task, waiter}, timeout=max(deadline - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            waiter.cancel()
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    task = asyncio.create_task(stream_command(cmd, max(spools.search_timeout, timeout), on_line, progress))
+    try:
+        await wait_for(page_ready, deadline)
+        if page_ready.is_set() and not task.done():
+            # 第一页已满：等到下一行到达或 rg 退出，再决定是否给出游标
+            await wait_for(more_ready, deadline)
+    except asyncio.CancelledError:
+        # 调用方取消：结束 rg 并丢弃结果文件
+        task.cancel()
+        if spool is not None:
+            spools.discard(spool)
+        raise
+
+    if task.done():
+        try:
+            status = task.result()
+        except FileNotFoundError:
+            logger.error("ripgrep (rg.exe) not found")
+            status = "Error: ripgrep executable not found in PATH"
+        except Exception as ex:
+            logger.error(f"Unexpected error: {str(ex)}")
+            status = f"Error: {str(ex)}"
+        if spool is not None and spool.lines == 0:
+            # 输出恰好填满第一页
+            spools.discard(spool)
+            spool = None
+        if status.startswith("Error:"):
+            if spool is not None:
+                spools.discard(spool)
+            return status
+        if status == "timeout" and not page:
+            return f"Error: Operation timed out after {timeout} seconds"
+        if spool is None:
+            output_text = "".join(page)
+            if status == "timeout":
+                output_text += f"\n[Search timed out after {timeout:.0f} seconds; results are partial]\n"
+            elif len(page) >= page_lines:
+                output_text += f"\n[Showing lines 1-{len(page)} (of {len(page)}); end of results]\n"
+            return output_text
+        spool.finish("full" if status == "stopped" else status)
+        total = f"of {len(page) + spool.lines}"
+    else:
+        if spool is None:
+            # 超时时第一页仍未填满：已有的行作为第一页，其余结果在后台继续写入
+            spool = spools.create(first_line=len(page) + 1)
+        spool.task = task
+        task.add_done_callback(spool.on_task_done)
+        total = "so far; the search is still running"
+
+    cursor = f"{spool.id}:0:0"
+    footer = (
+        f'\n[Showing lines 1-{len(page)} ({total}). '
+        f'Call search_rg_next with cursor "{cursor}" for more]\n'
+    )
+    return "".join(page) + footer
+
+
+async def execute_search(
+    params: RGSearchParams,
+    cmd: List[str],
+    timeout: float,
+    keep_partial: bool = False,
+    spools: Optional[SpoolManager] = None,
+    progress: Optional[SearchProgress] = None,
+    budget: Optional[LineBudget] = None,
+) -> str:
+    """Run a command built by build_rg_command in the output mode the params ask for.
+
+    With `spools`, raw output beyond `max_output_lines` is kept for paging instead of discarded.
+    A `budget` shared with concurrent searches stops the search once they found enough lines together.
+    """
+    max_lines = params.max_output_lines or 1000
+    if params.structured and not params.files_only:
+        return await run_structured(cmd, timeout, max_lines, progress, budget)
+    if spools is not None:
+        return await run_paged(cmd, timeout, max_lines, spools, progress)
+    return await run_command(
+        cmd, timeout, max_output_lines=max_lines, keep_partial=keep_partial, progress=progress, budget=budget
+    )
 
 
-def rg_search(params: RGSearchParams, timeout: int = 30) -> str:
+def list_search_roots() -> List[str]:
+    """Local drives (Windows) or local mount points (elsewhere) searched when the default path finds nothing."""
+    roots = []
+    for partition in psutil.disk_partitions():
+        # 没有文件系统（如空光驱）或网络文件系统的分区不参与遍历
+        if not partition.fstype or partition.fstype.lower() in _REMOTE_FSTYPES:
+            continue
+        if os.name == "nt":
+            if not partition.device[0].isalpha():
+                continue
+            root = partition.device if partition.device.endswith("\\") else partition.device + "\\"
+        else:
+            root = partition.mountpoint
+        if root not in roots:
+            roots.append(root)
+    return roots
+
+
+async def is_reachable(root: str, timeout: float) -> bool:
+    """Whether a directory can be listed within timeout (hung network drives and mounts are not)."""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def probe() -> None:
+        try:
+            with os.scandir(root) as entries:
+                next(entries, None)
+            result = True
+        except OSError:
+            result = False
+        try:
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(result))
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+    # 使用守护线程：卡在无响应挂载点上的探测不会阻止进程退出
+    threading.Thread(target=probe, daemon=True).start()
+    try:
+        return await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        return False
+
+
+async def search_all_drives(
+    params: RGSearchParams, timeout: float, progress: Optional[SearchProgress] = None
+) -> str:
+    """
+    在所有本地盘符（非 Windows 系统为各本地挂载点）上并发执行同一搜索。
+
+    所有搜索共用一个 `timeout` 截止时间，到期时保留各盘已得到的部分结果；
+    各盘的结果行到达时即计入总数，达到 `max_output_lines` 后停止其余仍在进行的搜索，
+    已找到的结果保留；错误信息不计入行数。
+    无法在 _PROBE_TIMEOUT 秒内列出根目录的盘符被跳过。结果按盘符分段并标注状态。
+    """
+    roots = list_search_roots()
+    if not roots:
+        logger.error("No local disks detected.")
+        return "No local disks detected."
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    max_lines = params.max_output_lines or 1000
+    label = "Drive" if os.name == "nt" else "Mount"
+
+    reachable = await asyncio.gather(*(is_reachable(root, min(_PROBE_TIMEOUT, timeout)) for root in roots))
+    # 各盘的结果行到达时即计入共同的上限，达到后其余搜索立即停止并保留已有结果
+    budget = LineBudget(max_lines, json_mode=params.structured and not params.files_only)
+    statuses = {}
+    tasks = {}
+    for root, ok in zip(roots, reachable):
+        if not ok:
+            logger.warning(f"Skipping {root}: unreachable or no response within {_PROBE_TIMEOUT} seconds")
+            statuses[root] = "skipped, unreachable or not responding"
+            continue
+        cmd = build_rg_command(params.model_copy(update={"path": root}))
+        if os.name != "nt":
+            # 挂载点之间互相嵌套（如 / 与 /home），每个搜索只停留在自己的文件系统内
+            cmd.insert(1, "--one-file-system")
+        logger.info(f"Searching {root}...")
+        task = asyncio.create_task(execute_search(
+            params, cmd, timeout=max(deadline - loop.time(), 0), keep_partial=True, progress=progress,
+            budget=budget,
+        ))
+        tasks[task] = root
+
+    stopped = set()
+    pending = set(tasks)
+    limit_reached = asyncio.create_task(budget.exhausted.wait())
+    try:
+        while pending and not limit_reached.done():
+            _, pending = await asyncio.wait(pending | {limit_reached}, return_when=asyncio.FIRST_COMPLETED)
+            pending.discard(limit_reached)
+        if pending:
+            # 达到上限：仍在运行的搜索已由预算停止，等待它们返回已有的结果
+            stopped = {tasks[task] for task in pending}
+            logger.info(f"Result limit of {max_lines} lines reached, stopped {len(pending)} searches")
+            await asyncio.wait(pending)
+    finally:
+        # 调用方取消时结束其余搜索（stream_command 会结束 rg 进程树）
+        limit_reached.cancel()
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    outputs = {root: task.result() for task, root in tasks.items()}
+
+    sections = []
+    remaining = max_lines
+    for root in roots:
+        if root in statuses:
+            sections.append(f"{label} {root} ({statuses[root]})")
+            continue
+        output = outputs[root]
+        if output.startswith("Error:"):
+            # 错误信息不计入结果行数
+            sections.append(f"{label} {root}: {output.strip()}")
+            continue
+        lines = [line for line in output.splitlines() if line]
+        if all(line.startswith("[") for line in lines):
+            # 没有结果行，只有截断等说明
+            if root in stopped:
+                sections.append(f"{label} {root} (cancelled, result limit reached)")
+            else:
+                sections.append(f"{label} {root}: no matches")
+            continue
+        # 只有结果行计入上限，方括号开头的说明行照常保留
+        shown = []
+        for line in lines:
+            if not line.startswith("["):
+                if remaining == 0:
+                    shown.append("[Output truncated due to exceeding max_output_lines limit]")
+                    break
+                remaining -= 1
+            shown.append(line)
+        sections.append(f"{label} {root}:\n" + "\n".join(shown))
+    return "\n".join(sections)
+
+
+async def rg_search(params: RGSearchParams, timeout: int = 30, spools: Optional[SpoolManager] = None) -> str:
     """
     封装：使用给定参数构建命令并执行搜索，
     返回结果或错误信息（必要时截断）。
     """
     cmd = build_rg_command(params)
-    result = run_command(cmd, timeout=timeout, max_output_lines=params.max_output_lines or 1000)
+    result = await execute_search(params, cmd, timeout, spools=spools)
     return result
 
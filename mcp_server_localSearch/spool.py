@@ -0,0 +1,210 @@
+import asyncio
+import atexit
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from typing import List, Optional, Tuple
+import psutil
+
+logger = logging.getLogger("rg_search")
+
+
+class ResultSpool:
+    """
+    一次搜索在第一页之后的输出：rg 仍在运行时逐行追加到磁盘文件，
+    通过游标（spool id、字节偏移、已读行数）分页读取。
+    """
+    def __init__(self, manager: "SpoolManager", spool_id: str, path: str, first_line: int) -> None:
+        self.manager = manager
+        self.id = spool_id
+        self.path = path
+        # 第一页已返回的行之后的行号（从 1 开始计）
+        self.first_line = first_line
+        self.lines = 0
+        self.bytes = 0
+        # running / done / timeout / full / cancelled / error
+        self.status = "running"
+        self.task: Optional[asyncio.Task] = None
+        self.last_access = time.monotonic()
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._updated = asyncio.Event()
+
+    @property
+    def running(self) -> bool:
+        return self.status == "running"
+
+    def write(self, line: str) -> bool:
+        """Append one output line; returns False once the spool or the total quota is full."""
+        if not self.running:
+            return False
+        if self.bytes >= self.manager.max_spool_bytes or self.manager.total_bytes >= self.manager.quota_bytes:
+            logger.warning(f"Spool {self.id} reached its size limit, stopping the search")
+            return False
+        data = line if line.endswith("\n") else line + "\n"
+        self._file.write(data)
+        self.lines += 1
+        self.bytes += len(data.encode("utf-8"))
+        self._updated.set()
+        return True
+
+    def finish(self, status: str) -> None:
+        if not self.running:
+            return
+        self.status = status
+        self._file.close()
+        self._updated.set()
+        logger.info(f"Spool {self.id} finished ({status}): {self.lines} lines, {self.bytes} bytes")
+
+    def on_task_done(self, task: asyncio.Task) -> None:
+        """Record how the background search ended."""
+        if task.cancelled():
+            self.finish("cancelled")
+        elif task.exception() is not None:
+            logger.error(f"Search for spool {self.id} failed: {task.exception()}")
+            self.finish("error")
+        else:
+            # 回调返回 False 使搜索提前停止，只会因为磁盘配额
+            status = task.result()
+            self.finish("full" if status == "stopped" else status)
+
+    def _read_from(self, offset: int, max_lines: int) -> Tuple[List[str], int]:
+        if not self._file.closed:
+            self._file.flush()
+        lines = []
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            while len(lines) < max_lines:
+                raw = f.readline()
+                # 只返回完整的行，写了一半的行留到下次读取
+                if not raw or not raw.endswith(b"\n"):
+                    break
+                lines.append(raw.decode("utf-8", errors="replace"))
+                offset += len(raw)
+        return lines, offset
+
+    async def read(self, offset: int, max_lines: int, wait: float) -> Tuple[List[str], int]:
+        """Read up to max_lines from offset, waiting up to `wait` seconds for a running search to produce them."""
+        self.last_access = time.monotonic()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        while True:
+            lines, new_offset = self._read_from(offset, max_lines)
+            remaining = deadline - loop.time()
+            if len(lines) >= max_lines or not self.running or remaining <= 0:
+                self.last_access = time.monotonic()
+                return lines, new_offset
+            self._updated.clear()
+            try:
+                await asyncio.wait_for(self._updated.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+class SpoolManager:
+    """
+    管理分页搜索的结果文件：按最后访问时间过期（TTL），
+    并限制单个文件和所有文件的总大小，超出总配额时淘汰最久未访问的。
+    """
+    def __init__(
+        self,
+        root: Optional[str] = None,
+        ttl: float = 600.0,
+        quota_bytes: int = 512 * 1024 * 1024,
+        max_spool_bytes: int = 64 * 1024 * 1024,
+        search_timeout: float = 300.0,
+    ) -> None:
+        self.root = root or os.path.join(tempfile.gettempdir(), "rg_search_spool")
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.max_spool_bytes = max_spool_bytes
+        # 返回第一页后，后台继续搜索的最长时间（秒）
+        self.search_timeout = search_timeout
+        self._spools: dict = {}
+        self._directory: Optional[str] = None
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(spool.bytes for spool in self._spools.values())
+
+    def _ensure_directory(self) -> str:
+        """Per-process spool directory; directories left by processes that are gone are removed."""
+        if self._directory is None:
+            os.makedirs(self.root, exist_ok=True)
+            for name in os.listdir(self.root):
+                if name.isdigit() and not psutil.pid_exists(int(name)):
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+            # 游标只在本进程内有效，每个进程（包括同一服务器的多个副本）使用自己的目录
+            self._directory = os.path.join(self.root, str(os.getpid()))
+            os.makedirs(self._directory, exist_ok=True)
+            atexit.register(shutil.rmtree, self._directory, True)
+        return self._directory
+
+    def create(self, first_line: int) -> ResultSpool:
+        self.sweep()
+        spool_id = uuid.uuid4().hex[:12]
+        path = os.path.join(self._ensure_directory(), f"{spool_id}.spool")
+        spool = ResultSpool(self, spool_id, path, first_line)
+        self._spools[spool_id] = spool
+        return spool
+
+    def get(self, spool_id: str) -> Optional[ResultSpool]:
+        self.sweep()
+        return self._spools.get(spool_id)
+
+    def discard(self, spool: ResultSpool) -> None:
+        """Stop the spool's search if it is still running and delete its file."""
+        self._spools.pop(spool.id, None)
+        spool.finish("cancelled")
+        if spool.task is not None and not spool.task.done():
+            # 取消任务会结束 rg 进程树
+            spool.task.cancel()
+        try:
+            os.remove(spool.path)
+        except OSError:
+            pass
+
+    def sweep(self) -> None:
+        """Drop expired spools, then the least recently read ones while over the disk quota."""
+        now = time.monotonic()
+        for spool in list(self._spools.values()):
+            if now - spool.last_access > self.ttl:
+                logger.info(f"Spool {spool.id} expired")
+                self.discard(spool)
+        spools = sorted(self._spools.values(), key=lambda s: s.last_access)
+        while spools and self.total_bytes > self.quota_bytes:
+            spool = spools.pop(0)
+            logger.info(f"Spool {spool.id} evicted to stay within the disk quota")
+            self.discard(spool)
+
+    async def next_page(self, cursor: str, max_lines: int = 1000, wait: float = 10.0) -> str:
+        """Render the page of spooled lines that starts at cursor."""
+        try:
+            spool_id, offset_text, index_text = cursor.strip().strip('"').split(":")
+            offset, index = int(offset_text), int(index_text)
+        except ValueError:
+            return f"Error: invalid cursor {cursor!r}"
+        spool = self.get(spool_id)
+        if spool is None:
+            return "Error: cursor expired or unknown; run the search again"
+
+        lines, new_offset = await spool.read(offset, max(max_lines, 1), max(wait, 0))
+        index_after = index + len(lines)
+        first = spool.first_line + index
+        last = first + len(lines) - 1
+        output = "".join(lines)
+        if not lines and spool.running:
+            return f'[No new lines within {wait:.0f} seconds; the search is still running. Retry with cursor "{cursor}"]\n'
+        if not lines:
+            return "[No more lines; end of results]\n"
+        if spool.running or index_after < spool.lines:
+            total = "so far" if spool.running else f"of {spool.first_line - 1 + spool.lines}"
+            next_cursor = f"{spool.id}:{new_offset}:{index_after}"
+            return output + f'\n[Lines {first}-{last} ({total}); call search_rg_next with cursor "{next_cursor}" for more]\n'
+        footer = f"\n[Lines {first}-{last} of {spool.first_line - 1 + spool.lines}; end of results]\n"
+        if spool.status in ("timeout", "full"):
+            reason = "time limit reached" if spool.status == "timeout" else "spool size limit reached"
+            footer += f"[The search stopped early ({reason}); results may be incomplete]\n"
+        return output + footer
@@ -0,0 +1,38 @@
+import asyncio
+import sys
+
+import pytest
+
+from rg_search import _MAX_LINE_BYTES, stream_command
+
+
+def collect(script: str) -> list:
+    lines = []
+
+    def on_line(line: str) -> bool:
+        lines.append(line.rstrip("\n"))
+        return True
+
+    status = asyncio.run(stream_command([sys.executable, "-c", script], 30, on_line))
+    assert status == "done"
+    return lines
+
+
+@pytest.mark.parametrize("length", [
+    _MAX_LINE_BYTES + 10,
+    _MAX_LINE_BYTES + 40 * 1024,
+    3 * _MAX_LINE_BYTES,
+])
+def test_overlong_line_is_skipped_alone(length):
+    script = f"import sys; sys.stdout.write('FIRST\\n' + 'x' * {length} + '\\nSECOND\\nTHIRD\\n')"
+    assert collect(script) == ["FIRST", "SECOND", "THIRD"]
+
+
+def test_line_at_limit_is_kept():
+    script = f"import sys; sys.stdout.write('x' * {_MAX_LINE_BYTES - 1} + '\\nSECOND\\n')"
+    lines = collect(script)
+    assert len(lines) == 2 and lines[1] == "SECOND"
+
+
+def test_last_line_without_newline():
+    assert collect("import sys; sys.stdout.write('A\\nB')") == ["A", "B"]
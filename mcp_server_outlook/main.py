@@ -1,3 +1,4 @@
+import argparse
 from mcp.server.fastmcp import FastMCP
 import os
 import logging
@@ -279,4 +280,16 @@ def send_email(recipients: str, subject: str, content: str, content_type: str =
 
 
 if __name__ == "__main__":
-    mcp.run()
+    parser = argparse.ArgumentParser(description="Outlook MCP Server")
+    parser.add_argument(
+        "--transport",
+        choices=["stdio", "sse"],
+        default="stdio",
+        help="stdio: run as a client's child process; sse: serve many clients over HTTP",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8003)
+    args = parser.parse_args()
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    mcp.run(transport=args.transport)